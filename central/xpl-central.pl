@@ -246,6 +246,7 @@ while ( (defined($xpl_socket)) && ($xpl_end == 0) ) {
   my ($xpl_message) = xpl_get_message($xpl_socket, $timeout);
   if ($xpl_message) {
     my ($type, $source, $target, $schema, %body) = xpl_get_message_elements($xpl_message);
+    my $trace = xpl_get_message_trace($xpl_message);
     if ($schema ne 'hbeat.app') {
       if ($verbose >  0) {
         print("Received: $type\_$source\_$target\_$schema\n");
@@ -297,8 +298,8 @@ while ( (defined($xpl_socket)) && ($xpl_end == 0) ) {
           my $type = shift(@command);
           my $target = shift(@command);
           my $schema = shift(@command);
-          xpl_send_message(
-            $xpl_socket, $xpl_port,
+          xpl_send_traced_message(
+            $xpl_socket, $xpl_port, $trace,
             $type, $xpl_id, $target, $schema,
             %command
           );
@@ -329,6 +330,8 @@ This xPL client examines all xPL messages it receives
 and matches them with XML data from a file.
 If a match is found, one or more xPL messages are sent as specified in the XML.
 Sleep commands can be inserted between xPL messages to send.
+The trace header line of a received message is carried forward,
+one hop further, to the messages sent for it.
 
 =head1 OPTIONS
 
@@ -3,8 +3,10 @@ import argparse
 import sys
 import signal
 import os
+import socket
 import time
-from datetime import datetime
+import heapq
+from datetime import datetime, timedelta
 sys.path.append(sys.path[0]+'/../xPL-base')
 import common
 
@@ -15,6 +17,15 @@ VENDOR_ID = 'dspc';             # from xplproject.org
 DEVICE_ID = 'clock';            # max 8 chars
 CLASS_ID = 'clock';             # max 8 chars
 
+MAXIMAL_SLEEP = 10;             # seconds between heartbeat and jump checks
+CLOCK_JUMP_TOLERANCE = 2;       # seconds of wall clock step seen as a jump
+TICK_PERIOD = 60;               # seconds between clock.tick messages
+CRON_FIELDS = [                 # name, minimum and maximum of cron fields
+    ('second', 0, 59), ('minute', 0, 59), ('hour', 0, 23),
+    ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7)
+]
+CRON_SEARCH_LENGTH = 100000;    # steps before a cron entry is seen as never due
+
 INDENT = '  '
 SEPARATOR = 80 * '-'
 
@@ -46,6 +57,43 @@ parser.add_argument(
 parser.add_argument(
     '-w', '--wait', default=0,
     help = 'the startup sleep interval in seconds'
+)
+                                                              # sequence numbers
+parser.add_argument(
+    '-q', '--sequence', action='store_true', dest='sequence',
+    help = 'number the sent messages to allow loss detection'
+)
+                                                                  # trace origin
+parser.add_argument(
+    '-T', '--trace', action='store_true', dest='trace',
+    help = 'stamp a new trace on the clock.tick and clock.event messages'
+)
+                                                                 # schedule file
+parser.add_argument(
+    '-s', '--schedule', default='',
+    help = 'the file of the scheduled clock.event messages'
+)
+                                                          # seconds tick periods
+def argument_string_to_intervals(parameter):
+    intervals = []
+    for interval in parameter.split(',') :
+        if not interval.isdigit() or int(interval) == 0 :
+            raise argparse.ArgumentTypeError(
+                "\"%s\" is not a positive integer" % interval
+            )
+        intervals.append(int(interval))
+
+    return(intervals)
+
+parser.add_argument(
+    '-g', '--granularities', default='1,5,15,30',
+    type=argument_string_to_intervals,
+    help = 'the clock.seconds tick intervals in seconds subscribers can choose'
+)
+                                                       # subscription lease time
+parser.add_argument(
+    '-l', '--lease', default=300,
+    help = 'the seconds after which an unrenewed subscription expires'
 )
                                                   # parse command line arguments
 parser_arguments = parser.parse_args()
@@ -54,6 +102,12 @@ Ethernet_base_port = parser_arguments.port
 instance_id = parser_arguments.id
 heartbeat_interval = int(parser_arguments.timer)
 startup_delay = int(parser_arguments.wait)
+schedule_file_spec = parser_arguments.schedule
+tick_intervals = parser_arguments.granularities
+lease_time = int(parser_arguments.lease)
+trace_messages = parser_arguments.trace
+if parser_arguments.sequence :
+    common.xpl_enable_sequence_numbers()
 
 debug = False
 
@@ -62,17 +116,272 @@ debug = False
 #
 
 #-------------------------------------------------------------------------------
-# Check the time and send a clock update message every beginning of a minute
+# Get the wall clock time of the next multiple of a period
+#
+def next_boundary(now, period=TICK_PERIOD) :
+    return((now // period + 1) * period)
+
+#-------------------------------------------------------------------------------
+# Start the trace of an originated message
+#
+def start_trace() :
+    trace = None
+    if trace_messages :
+        trace = common.xpl_new_trace()
+
+    return(trace)
+
+#-------------------------------------------------------------------------------
+# Update the tick jitter statistics with the delay of a tick in seconds
+#
+def update_jitter(jitter, delay) :
+    jitter['ticks'] += 1
+    jitter['last'] = delay
+    jitter['total'] += delay
+    jitter['maximum'] = max(jitter['maximum'], delay)
+
+#-------------------------------------------------------------------------------
+# Send the clock status with the tick jitter in milliseconds
+#
+def send_status(jitter, target='*', trace=None) :
+    mean_delay = 0
+    if jitter['ticks'] :
+        mean_delay = jitter['total'] / jitter['ticks']
+    common.xpl_send_message(
+        xpl_socket, common.XPL_PORT,
+        'xpl-stat', xpl_id, target, "%s.basic" % CLASS_ID,
+        {
+            'ticks'   : jitter['ticks'],
+            'last'    : "%.1f" % (1000*jitter['last']),
+            'mean'    : "%.1f" % (1000*mean_delay),
+            'maximum' : "%.1f" % (1000*jitter['maximum']),
+            'resyncs' : jitter['resyncs']
+        },
+        trace
+    );
+
+#-------------------------------------------------------------------------------
+# Build the pre-encoded clock.seconds message of a tick interval
+#   only the sequence number, time, iso and epoch fields are left
+#
+def build_seconds_template(interval) :
+    message = "xpl-stat\n{\nhop=1\nsource=%s\ntarget=*\n" % xpl_id
+    if common.sequence_numbering :
+        message += "seq=%d\n"
+    message += "}\n%s.seconds\n{\ninterval=%d\n" % (CLASS_ID, interval)
+    message += "time=%s\niso=%s\nepoch=%d\n}\n"
+
+    return(message.encode())
+
+#-------------------------------------------------------------------------------
+# Send a clock.seconds tick of an interval with the epoch time in milliseconds
+#   a single broadcast for all the subscribers, which select their interval
+#
+def send_seconds_tick(interval, tick_time) :
+    moment = datetime.fromtimestamp(tick_time).astimezone()
+    values = (
+        moment.strftime('%H:%M:%S').encode(),
+        moment.isoformat(timespec='seconds').encode(),
+        round(1000*tick_time)
+    )
+    if common.sequence_numbering :
+        values = (common.xpl_next_sequence_number(xpl_id),) + values
+    xpl_socket.sendto(
+        seconds_templates[interval] % values, ('<broadcast>', common.XPL_PORT)
+    )
+
+#-------------------------------------------------------------------------------
+# Add, renew or remove a subscription to the ticks of an interval
+#   the reply gives the lease time, 0 if the subscription isn't held
+#
+def update_subscription(source, interval, subscribe, now, trace=None) :
+    lease = 0
+    if interval in tick_intervals :
+        if subscribe :
+            subscriptions.setdefault(interval, {})[source] = now + lease_time
+            lease = lease_time
+            if interval not in seconds_ticks :
+                seconds_ticks[interval] = next_boundary(now, interval)
+        elif source in subscriptions.get(interval, {}) :
+            del subscriptions[interval][source]
+    common.xpl_send_message(
+        xpl_socket, common.XPL_PORT,
+        'xpl-stat', xpl_id, source, "%s.basic" % CLASS_ID,
+        {
+            'interval' : interval,
+            'lease'    : lease
+        },
+        trace
+    );
+    if verbose :
+        print(INDENT + "%s ticks every %d s, lease %d s" % (
+            source, interval, lease
+        ))
+
+#-------------------------------------------------------------------------------
+# Remove the expired subscriptions and stop the intervals nobody listens to
+#
+def expire_subscriptions(now) :
+    for interval in list(subscriptions.keys()) :
+        for (source, expiry) in list(subscriptions[interval].items()) :
+            if expiry <= now :
+                del subscriptions[interval][source]
+        if not subscriptions[interval] :
+            del subscriptions[interval]
+    for interval in list(seconds_ticks.keys()) :
+        if interval not in subscriptions :
+            del seconds_ticks[interval]
+
+#-------------------------------------------------------------------------------
+# Parse a cron field into the set of its values
+#   "*", "a", "a-b", "*/n", "a-b/n" and comma separated lists thereof
+#
+def parse_cron_field(field, minimum, maximum) :
+    values = set()
+    for item in field.split(',') :
+        step = 1
+        if '/' in item :
+            (item, step) = item.split('/')
+            step = int(step)
+        if item == '*' :
+            (first, last) = (minimum, maximum)
+        elif '-' in item :
+            (first, last) = [int(value) for value in item.split('-')]
+        else :
+            first = int(item)
+            last = first
+            if step > 1 :
+                last = maximum
+        if (first < minimum) or (last > maximum) or (step < 1) :
+            raise ValueError("\"%s\" out of range" % field)
+        if first > last :
+            raise ValueError("\"%s\" is a reversed range" % field)
+        values.update(range(first, last+1, step))
+
+    return(values)
+
+#-------------------------------------------------------------------------------
+# Parse a schedule line
+#   cron entry : second minute hour day month weekday target event [name=value]
+#   one-shot   : @ YYYY-MM-DD HH:MM:SS target event [name=value]
+#
+def parse_schedule_line(line) :
+    words = line.split()
+    entry = {}
+    if words[0] == '@' :
+        entry['time'] = datetime.strptime(
+            ' '.join(words[1:3]), '%Y-%m-%d %H:%M:%S'
+        ).timestamp()
+        words = words[3:]
+    else :
+        for (index, (name, minimum, maximum)) in enumerate(CRON_FIELDS) :
+            entry[name] = parse_cron_field(words[index], minimum, maximum)
+        if 7 in entry['weekday'] :
+            entry['weekday'].add(0)
+        entry['any day'] = (words[3] == '*')
+        entry['any weekday'] = (words[5] == '*')
+        words = words[len(CRON_FIELDS):]
+    entry['target'] = words[0]
+    entry['body'] = {'event': words[1]}
+    for parameter in words[2:] :
+        (name, value) = parameter.split('=', 1)
+        entry['body'][name] = value
+
+    return(entry)
+
+#-------------------------------------------------------------------------------
+# Load the schedule file
+#
+def load_schedule(file_spec) :
+    entries = []
+    for line in open(file_spec, 'r') :
+        line = line.split('#', 1)[0].strip()
+        if line :
+            try :
+                entries.append(parse_schedule_line(line))
+            except (ValueError, IndexError) as error :
+                print(
+                    "Skipping schedule line \"%s\": %s" % (line, error),
+                    file=sys.stderr
+                )
+    if verbose :
+        print(INDENT + "loaded %d scheduled events" % len(entries))
+
+    return(entries)
+
+#-------------------------------------------------------------------------------
+# Get the time at which an entry is due next, None if it is never due again
+#   with cron, a restricted day or weekday is enough if both are restricted
 #
-def tick(last_time) :
-                                                          # get time information
-    now = datetime.now()
-    time = now.strftime('%Hh%M');
-                                                             # check if new time
-    if (time == last_time) :
-        time = ''
+def next_due_time(entry, after) :
+    if 'time' in entry :
+        due_time = None
+        if entry['time'] > after :
+            due_time = entry['time']
+        return(due_time)
+    moment = datetime.fromtimestamp(int(after) + 1)
+    for step in range(CRON_SEARCH_LENGTH) :
+        day_matches = moment.day in entry['day']
+        weekday_matches = (moment.isoweekday() % 7) in entry['weekday']
+        if entry['any day'] or entry['any weekday'] :
+            day_matches = day_matches and weekday_matches
+        else :
+            day_matches = day_matches or weekday_matches
+        if moment.month not in entry['month'] :
+            moment = (moment.replace(day=1) + timedelta(days=32)).replace(
+                day=1, hour=0, minute=0, second=0
+            )
+        elif not day_matches :
+            moment = (moment + timedelta(days=1)).replace(
+                hour=0, minute=0, second=0
+            )
+        elif moment.hour not in entry['hour'] :
+            moment = (moment + timedelta(hours=1)).replace(minute=0, second=0)
+        elif moment.minute not in entry['minute'] :
+            moment = (moment + timedelta(minutes=1)).replace(second=0)
+        elif moment.second not in entry['second'] :
+            moment = moment + timedelta(seconds=1)
+        else :
+            return(moment.timestamp())
 
-    return(time)
+    return(None)
+
+#-------------------------------------------------------------------------------
+# Build the priority queue of the due times of the schedule entries
+#
+def build_schedule_queue(entries, now) :
+    schedule_queue = []
+    for (index, entry) in enumerate(entries) :
+        due_time = next_due_time(entry, now)
+        if due_time is not None :
+            schedule_queue.append((due_time, index))
+    heapq.heapify(schedule_queue)
+
+    return(schedule_queue)
+
+#-------------------------------------------------------------------------------
+# Get the modification time of the schedule file
+#
+def schedule_modification_time() :
+    modification_time = None
+    if schedule_file_spec and os.path.isfile(schedule_file_spec) :
+        modification_time = os.path.getmtime(schedule_file_spec)
+
+    return(modification_time)
+
+#-------------------------------------------------------------------------------
+# Send a scheduled event
+#
+def send_event(entry, due_time) :
+    body = dict(entry['body'])
+    body['time'] = datetime.fromtimestamp(due_time).isoformat()
+    common.xpl_send_message(
+        xpl_socket, common.XPL_PORT,
+        'xpl-trig', xpl_id, entry['target'], "%s.event" % CLASS_ID,
+        body, start_trace()
+    );
+    if verbose :
+        print("Event \"%s\" for %s" % (body['event'], entry['target']))
 
 # ------------------------------------------------------------------------------
 # catch ctrl-C interrupt
@@ -98,6 +407,11 @@ xpl_ip = common.xpl_find_ip()
 (client_port, xpl_socket) = common.xpl_open_socket(
     common.XPL_PORT, Ethernet_base_port
 )
+xpl_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+                                                      # pre-encode seconds ticks
+seconds_templates = {}
+for interval in tick_intervals :
+    seconds_templates[interval] = build_seconds_template(interval)
                                                     # display working parameters
 if verbose :
     os.system('clear||cls')
@@ -109,12 +423,19 @@ if verbose :
 
 # ..............................................................................
                                                                   # main loop
-timeout = 1;
-sleep_for_next_minute = 60 - 10*timeout;
-is_first_minute = True;
 last_heartbeat_time = 0;
-last_message_time = 0;
 last_time = ''
+jitter = {'ticks': 0, 'last': 0, 'total': 0, 'maximum': 0, 'resyncs': 0}
+wall_time = time.time()
+monotonic_time = time.monotonic()
+next_tick = next_boundary(wall_time)
+subscriptions = {}
+seconds_ticks = {}
+schedule_entries = []
+schedule_time = schedule_modification_time()
+if schedule_time is not None :
+    schedule_entries = load_schedule(schedule_file_spec)
+schedule_queue = build_schedule_queue(schedule_entries, wall_time)
 
 while not end :
                                                  # check time and send heartbeat
@@ -122,32 +443,87 @@ while not end :
         xpl_socket, xpl_id, xpl_ip, client_port,
         heartbeat_interval, last_heartbeat_time
     )
-                                                                  # get new time
-    time.sleep(timeout);
-    present_time = tick(last_time);
-                                                        # send time tick message
-    if present_time :
+                             # wait for the next minute, event or an xPL message
+    next_wake_time = min([next_tick] + list(seconds_ticks.values()))
+    if schedule_queue :
+        next_wake_time = min(next_wake_time, schedule_queue[0][0])
+    timeout = min(max(next_wake_time - time.time(), 0), MAXIMAL_SLEEP)
+    (xpl_message, source_address) = common.xpl_get_message(xpl_socket, timeout);
+                                                    # check for wall clock jumps
+    now = time.time()
+    elapsed_time = time.monotonic() - monotonic_time
+    clock_jump = now - wall_time - elapsed_time
+    if abs(clock_jump) > CLOCK_JUMP_TOLERANCE :
+        next_tick = next_boundary(now)
+        for interval in seconds_ticks :
+            seconds_ticks[interval] = next_boundary(now, interval)
+        schedule_queue = build_schedule_queue(schedule_entries, now)
+        jitter['resyncs'] += 1
         if verbose :
-            if debug :
-                print('')
-            print("Time is %s" % present_time)
-        common.xpl_send_message(
-            xpl_socket, common.XPL_PORT,
-            'xpl-stat', xpl_id, '*', "%s.tick" % CLASS_ID,
-            {
-                'time' : present_time
-            }
-        );
-        last_time = present_time
-                                                           # leverage CPU effort
-        if not is_first_minute :
-            time.sleep(sleep_for_next_minute)
-            if debug :
-                print(INDENT + 'checking for next minute ', end='', flush=True)
-        is_first_minute = False
-                                                       # print debug information
-    else :
-        if debug :
-            print('.', end='', flush=True)
+            print(INDENT + "clock jumped by %.1f s" % clock_jump)
+    wall_time = now
+    monotonic_time += elapsed_time
+                                                        # send time tick message
+    if now >= next_tick :
+        present_time = time.strftime('%Hh%M', time.localtime(next_tick));
+        if present_time != last_time :
+            common.xpl_send_message(
+                xpl_socket, common.XPL_PORT,
+                'xpl-stat', xpl_id, '*', "%s.tick" % CLASS_ID,
+                {
+                    'time' : present_time
+                },
+                start_trace()
+            );
+            update_jitter(jitter, time.time() - next_tick)
+            if verbose :
+                print(
+                    "Time is %s (%.1f ms late)"
+                    % (present_time, 1000*jitter['last'])
+                )
+            last_time = present_time
+        next_tick = next_boundary(now)
+                                                    # send seconds tick messages
+    expire_subscriptions(now)
+    for (interval, tick_time) in seconds_ticks.items() :
+        if now >= tick_time :
+            send_seconds_tick(interval, tick_time)
+            seconds_ticks[interval] = next_boundary(now, interval)
+                                                           # send the due events
+    while schedule_queue and (schedule_queue[0][0] <= now) :
+        (due_time, index) = heapq.heappop(schedule_queue)
+        send_event(schedule_entries[index], due_time)
+        due_time = next_due_time(schedule_entries[index], due_time)
+        if due_time is not None :
+            heapq.heappush(schedule_queue, (due_time, index))
+                                                       # reload changed schedule
+    reload_schedule = False
+    if schedule_modification_time() != schedule_time :
+        reload_schedule = True
+                                                           # process XPL message
+    if (xpl_message) :
+        (xpl_type, source, target, schema, body) = \
+            common.xpl_get_message_elements(xpl_message)
+        trace = common.xpl_get_message_trace(xpl_message)
+        if schema == CLASS_ID + '.basic' :
+            if xpl_type == 'xpl-cmnd' :
+                if common.xpl_is_for_me(xpl_id, target) :
+                    if body.get('command') == 'status' :
+                        send_status(jitter, source, trace)
+                    elif body.get('command') == 'reload' :
+                        reload_schedule = True
+                    elif body.get('command') in ['subscribe', 'unsubscribe'] :
+                        if body.get('interval', '').isdigit() :
+                            update_subscription(
+                                source, int(body['interval']),
+                                body['command'] == 'subscribe', time.time(),
+                                trace
+                            )
+    if reload_schedule :
+        schedule_time = schedule_modification_time()
+        schedule_entries = []
+        if schedule_time is not None :
+            schedule_entries = load_schedule(schedule_file_spec)
+        schedule_queue = build_schedule_queue(schedule_entries, time.time())
                                                              # delete xPL socket
 common.xpl_disconnect(xpl_socket, xpl_id, xpl_ip, client_port)
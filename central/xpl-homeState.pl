@@ -216,6 +216,15 @@ while ( (defined($xpl_socket)) && ($xpl_end == 0) ) {
             $verbose,
             %body
           );
+                                               # acknowledge and drop duplicates
+          if (not xpl_accept_message(
+            $xpl_socket, $xpl_id, $xpl_message, $source
+          )) {
+            $command = '';
+            if ($verbose > 0) {
+              print($indent . "Discarding duplicate\n");
+            }
+          }
           if ($command) {
             if ($verbose > 0) {
               print($indent . "Command is \"$command\"\n");
@@ -226,8 +235,8 @@ while ( (defined($xpl_socket)) && ($xpl_end == 0) ) {
                 $configuration{'stateFile'},
                 $room, $kind, $object
               );
-              xpl_send_message(
-                $xpl_socket, $xpl_port,
+              xpl_send_traced_message(
+                $xpl_socket, $xpl_port, xpl_get_message_trace($xpl_message),
                 'xpl-stat', $xpl_id, $source, "$class_id.basic",
                 (
                   'room' => $room,
@@ -254,8 +263,8 @@ while ( (defined($xpl_socket)) && ($xpl_end == 0) ) {
                 if ($verbose > 0) {
                   print($indent . "Sending \"act\" message\n");
                 }
-#                 xpl_send_message(
-#                   $xpl_socket, $xpl_port,
+#                 xpl_send_traced_message(
+#                   $xpl_socket, $xpl_port, xpl_get_message_trace($xpl_message),
 #                   'xpl-cmnd', $xpl_id, '*', "$class_id.basic",
 #                   (
 #                     'command' => 'act',
@@ -323,6 +332,13 @@ In case the object's state has to be updated.
 
 =back
 
+Commands carrying a C<msgid> header line are acknowledged
+with an C<ack.basic> stat message.
+Their retransmitted duplicates are acknowledged again but not processed.
+
+The trace header line of a command is carried forward,
+one hop further, to its reply.
+
 The C<state.basic> stat message contains the following items:
 
 =over 8
@@ -4,6 +4,10 @@ import sys
 import signal
 import os
 import time
+import threading
+import collections
+import json
+import fnmatch
 sys.path.append(sys.path[0]+'/../xPL-base')
 import common
 import requests
@@ -41,6 +45,81 @@ parser.add_argument(
 parser.add_argument(
     '-w', '--wait', default=0,
     help = 'the startup sleep interval in seconds'
+)
+                                                          # connections per host
+parser.add_argument(
+    '-P', '--poolSize', default=4,
+    help = 'the maximal number of kept-alive connections per host'
+)
+                                                             # idle session time
+parser.add_argument(
+    '-i', '--idleTime', default=60,
+    help = 'the time in seconds after which an unused host session is closed'
+)
+                                                        # request worker threads
+parser.add_argument(
+    '-W', '--workers', default=4,
+    help = 'the number of threads sending the requests'
+)
+                                                        # requests sent per host
+parser.add_argument(
+    '-c', '--hostConcurrency', default=1,
+    help = 'the maximal number of requests sent at a time to the same host'
+)
+                                                               # queued requests
+parser.add_argument(
+    '-Q', '--queueSize', default=100,
+    help = 'the maximal number of requests waiting to be sent'
+)
+                                                      # drop superseded requests
+parser.add_argument(
+    '-L', '--latestWins', action='store_true', dest='latestWins',
+    help = 'drop queued requests superseded by one of same URL or coalesce key'
+)
+                                                            # connection timeout
+parser.add_argument(
+    '-C', '--connectTimeout', default=3,
+    help = 'the time in seconds to wait for a connection to a host'
+)
+                                                                  # read timeout
+parser.add_argument(
+    '-r', '--readTimeout', default=10,
+    help = 'the time in seconds to wait for a reply from a host'
+)
+                                                  # failures opening the circuit
+parser.add_argument(
+    '-f', '--failures', default=3,
+    help = 'the number of failed requests after which a host is given up'
+)
+                                                             # circuit open time
+parser.add_argument(
+    '-o', '--openTime', default=30,
+    help = 'the time in seconds before a given up host is tried again'
+)
+                                                          # failed request spool
+parser.add_argument(
+    '-s', '--spool', default='',
+    help = 'the file keeping the failed requests to replay them (none if empty)'
+)
+                                                                    # spool size
+parser.add_argument(
+    '-S', '--spoolSize', default=50,
+    help = 'the maximal number of failed requests kept in the spool'
+)
+                                                               # publish results
+parser.add_argument(
+    '-R', '--results', action='store_true', dest='results',
+    help = 'publish the sent, cached or shared result of each request'
+)
+                                                            # result body length
+parser.add_argument(
+    '-b', '--bodyLength', default=64,
+    help = 'the maximal number of reply body characters published'
+)
+                                                            # GET response cache
+parser.add_argument(
+    '-G', '--cache', default='',
+    help = 'cached GET URL patterns with their lifetime, as "glob=seconds,..."'
 )
                                                                      # verbosity
 parser.add_argument(
@@ -53,14 +132,546 @@ Ethernet_base_port = parser_arguments.port
 instance_id = parser_arguments.id
 heartbeat_interval = int(parser_arguments.timer)
 startup_delay = int(parser_arguments.wait)
+pool_size = int(parser_arguments.poolSize)
+session_idle_time = float(parser_arguments.idleTime)
+worker_count = int(parser_arguments.workers)
+host_concurrency = int(parser_arguments.hostConcurrency)
+queue_size = int(parser_arguments.queueSize)
+latest_wins = parser_arguments.latestWins
+request_timeout = (
+    float(parser_arguments.connectTimeout), float(parser_arguments.readTimeout)
+)
+failure_threshold = int(parser_arguments.failures)
+circuit_open_time = float(parser_arguments.openTime)
+spool_file_spec = parser_arguments.spool
+spool_size = int(parser_arguments.spoolSize)
+cache_rules = []
+for rule in filter(None, parser_arguments.cache.split(',')) :
+    (pattern, cache_time) = rule.rsplit('=', 1)
+    cache_rules.append((pattern, float(cache_time)))
+publish_results = parser_arguments.results
+body_length = int(parser_arguments.bodyLength)
 verbose = parser_arguments.verbose
 
 debug = False
 
+# ------------------------------------------------------------------------------
+# global variables
+#
+host_sessions = {}
+sessions_lock = threading.Lock()
+closed_connections = {'new': 0, 'requests': 0}
+host_queues = {}
+host_active = {}
+superseded_requests = {}
+work_condition = threading.Condition()
+host_health = {}
+health_lock = threading.Lock()
+request_spool = []
+spool_lock = threading.Lock()
+response_cache = {}
+requests_in_flight = {}
+cache_statistics = {'hits': 0, 'shared': 0}
+cache_lock = threading.Lock()
+
 # ==============================================================================
 # Internal functions
 #
 
+# ------------------------------------------------------------------------------
+# get the kept-alive session of a host
+#
+def get_session(host) :
+    with sessions_lock :
+        if host not in host_sessions :
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=pool_size
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            host_sessions[host] = {'session': session, 'adapter': adapter}
+        host_sessions[host]['used'] = time.monotonic()
+
+        return(host_sessions[host]['session'])
+
+# ------------------------------------------------------------------------------
+# count the connections opened and the requests sent by a session
+#
+def count_connections(host) :
+    new_connections = 0
+    request_count = 0
+    pools = host_sessions[host]['adapter'].poolmanager.pools
+    for key in pools.keys() :
+        pool = pools[key]
+        if pool is not None :
+            new_connections += pool.num_connections
+            request_count += pool.num_requests
+
+    return(new_connections, request_count)
+
+# ------------------------------------------------------------------------------
+# get the number of new and reused connections
+#
+def connection_statistics() :
+    with sessions_lock :
+        new_connections = closed_connections['new']
+        request_count = closed_connections['requests']
+        for host in host_sessions :
+            (host_new, host_requests) = count_connections(host)
+            new_connections += host_new
+            request_count += host_requests
+
+    return(new_connections, request_count - new_connections)
+
+# ------------------------------------------------------------------------------
+# close the sessions of the hosts which have not been used for a while
+#
+def evict_idle_sessions() :
+    now = time.monotonic()
+    with sessions_lock :
+        for host in list(host_sessions) :
+            if (now - host_sessions[host]['used'] > session_idle_time) and \
+                (host not in host_active) :
+                (host_new, host_requests) = count_connections(host)
+                closed_connections['new'] += host_new
+                closed_connections['requests'] += host_requests
+                host_sessions.pop(host)['session'].close()
+                if verbose :
+                    print(INDENT + "closed idle session to %s" % host)
+
+# ------------------------------------------------------------------------------
+# send a request through the session of its host
+#
+def send_request(method, host, request_URL) :
+    response = None
+    start_time = time.monotonic()
+    try :
+        response = get_session(host).request(
+            method, request_URL, timeout=request_timeout
+        )
+    except requests.RequestException :
+        if verbose :
+            print(INDENT + "request \"%s\" rejected" % request_URL)
+    elapsed_time = time.monotonic() - start_time
+    if verbose :
+        (new_connections, reused_connections) = connection_statistics()
+        print(
+            INDENT + "connections: %d new, %d reused"
+            % (new_connections, reused_connections)
+        )
+        if response is not None :
+            print(INDENT + "%d %s" % (response.status_code, response.reason))
+
+    return(response, elapsed_time)
+
+# ------------------------------------------------------------------------------
+# get the reply body, or the value at a dotted path of a JSON reply
+#   made fit for an xPL message body: line ends are replaced by spaces,
+#   braces by parentheses and equal signs by "%3D"
+#
+def get_reply_value(response, extract='') :
+    if extract :
+        try :
+            value = response.json()
+            for key in extract.split('.') :
+                if isinstance(value, list) :
+                    value = value[int(key)]
+                else :
+                    value = value[key]
+            if not isinstance(value, str) :
+                value = json.dumps(value)
+        except (ValueError, KeyError, IndexError, TypeError) :
+            value = ''
+    else :
+        value = response.text
+            # braces, line ends and equal signs delimit the xPL message elements
+    value = ' '.join(value.split())
+    value = value.replace('{', '(').replace('}', ')').replace('=', '%3D')
+
+    return(value[:body_length])
+
+# ------------------------------------------------------------------------------
+# publish the result of a request
+#
+def publish_result(request, response, elapsed_time, cache='') :
+    body = {
+        'method'  : request['method'],
+        'server'  : request['host'],
+        'path'    : request['path'],
+        'elapsed' : "%d" % round(1000*elapsed_time)
+    }
+    if cache :
+        body['cache'] = cache
+    if response is None :
+        body['status'] = 'failed'
+    else :
+        body['status'] = response.status_code
+        body['bytes'] = len(response.content)
+        if request.get('extract') :
+            body['value'] = get_reply_value(response, request['extract'])
+        else :
+            body['body'] = get_reply_value(response)
+    common.xpl_send_message(
+        xpl_socket, common.XPL_PORT,
+        'xpl-stat', xpl_id, '*', CLASS_ID + '.basic',
+        body, request.get('trace')
+    )
+
+# ------------------------------------------------------------------------------
+# get the time a GET reply is cached, from the rules and its Cache-Control
+#
+def get_cache_time(request, response=None) :
+    cache_time = 0
+    if request['method'] == 'GET' :
+        for (pattern, rule_time) in cache_rules :
+            if fnmatch.fnmatch(request['URL'], pattern) :
+                cache_time = rule_time
+                break
+    if (response is not None) and cache_time :
+        if response.status_code != 200 :
+            cache_time = 0
+        cache_control = response.headers.get('Cache-Control', '').lower()
+        for directive in cache_control.split(',') :
+            directive = directive.strip()
+            if directive in ['no-store', 'no-cache'] :
+                cache_time = 0
+            elif directive.startswith('max-age=') :
+                try :
+                    cache_time = min(cache_time, float(directive[8:]))
+                except ValueError :
+                    pass
+
+    return(cache_time)
+
+# ------------------------------------------------------------------------------
+# serve a GET request from the cache or from the same request in flight
+#   returns True if the request is not to be sent
+#   a request which is sent is marked in flight if start_flight is set
+#
+def serve_from_cache(request, start_flight=False) :
+    served = False
+    response = None
+    if get_cache_time(request) :
+        URL = request['URL']
+        with cache_lock :
+            if (URL in response_cache) and \
+                (response_cache[URL]['expires'] > time.monotonic()) :
+                response = response_cache[URL]['response']
+                cache_statistics['hits'] += 1
+                served = True
+            elif URL in requests_in_flight :
+                requests_in_flight[URL].append(request)
+                cache_statistics['shared'] += 1
+                served = True
+            elif start_flight :
+                requests_in_flight[URL] = []
+    if publish_results and (response is not None) :
+        publish_result(request, response, 0, 'hit')
+    if served and verbose :
+        print(
+            INDENT + "cache: %d hits, %d shared"
+            % (cache_statistics['hits'], cache_statistics['shared'])
+        )
+
+    return(served)
+
+# ------------------------------------------------------------------------------
+# store the reply of a request in flight and publish it for the requests
+# which have been waiting for it
+#
+def complete_flight(request, response, elapsed_time) :
+    URL = request['URL']
+    now = time.monotonic()
+    with cache_lock :
+        if URL not in requests_in_flight :
+            return
+        waiting = requests_in_flight.pop(URL)
+        for cached_URL in list(response_cache) :
+            if response_cache[cached_URL]['expires'] <= now :
+                response_cache.pop(cached_URL)
+        if response is not None :
+            cache_time = get_cache_time(request, response)
+            if cache_time :
+                response_cache[URL] = {
+                    'response': response, 'expires': now + cache_time
+                }
+    if publish_results :
+        for waiting_request in waiting :
+            publish_result(waiting_request, response, elapsed_time, 'shared')
+
+# ------------------------------------------------------------------------------
+# get the key telling which requests supersede each other
+#   the coalesce value of the command if given, otherwise the full URL
+#
+def request_key(request) :
+    if request.get('coalesce') :
+        key = (request['host'], request['coalesce'])
+    else :
+        key = (request['method'], request['host'], request['URL'])
+
+    return(key)
+
+# ------------------------------------------------------------------------------
+# drop the queued request with the same key which is superseded by a new one
+#   to be called with the work condition held
+#
+def drop_superseded_request(request) :
+    host = request['host']
+    pending = host_queues.get(host, [])
+    for queued in pending :
+        if request_key(queued) == request_key(request) :
+            pending.remove(queued)
+            if not pending :
+                host_queues.pop(host)
+            superseded_requests[host] = superseded_requests.get(host, 0) + 1
+            if verbose :
+                print(
+                    INDENT + "superseded \"%s\" (%d for %s)"
+                    % (queued['URL'], superseded_requests[host], host)
+                )
+            break
+
+# ------------------------------------------------------------------------------
+# queue a request for the workers
+#   the requests to a host are sent in the order they have been queued
+#
+def queue_request(request) :
+    host = request['host']
+    if serve_from_cache(request) :
+        return
+    with work_condition :
+        if latest_wins :
+            drop_superseded_request(request)
+        queued = sum(len(pending) for pending in host_queues.values())
+        if queued >= queue_size :
+            if verbose :
+                print(INDENT + "queue full, dropped \"%s\"" % request['URL'])
+            return
+        if host not in host_queues :
+            host_queues[host] = collections.deque()
+        host_queues[host].append(request)
+        work_condition.notify()
+
+# ------------------------------------------------------------------------------
+# publish the health of a host
+#
+def publish_host_health(host) :
+    health = host_health[host]
+    with spool_lock :
+        spooled = len([item for item in request_spool if item['host'] == host])
+    with work_condition :
+        superseded = superseded_requests.get(host, 0)
+    common.xpl_send_message(
+        xpl_socket, common.XPL_PORT,
+        'xpl-trig', xpl_id, '*', CLASS_ID + '.status',
+        {
+            'host'       : host,
+            'state'      : health['state'],
+            'failures'   : health['failures'],
+            'spooled'    : spooled,
+            'superseded' : superseded
+        }
+    )
+    if verbose :
+        print(INDENT + "host %s is %s" % (host, health['state']))
+
+# ------------------------------------------------------------------------------
+# check the circuit breaker of a host before sending a request
+#   closed: requests are sent
+#   open: requests fail fast until the open time has elapsed
+#   half-open: a single trial request is sent
+#
+def circuit_allows(host) :
+    allowed = True
+    changed = False
+    with health_lock :
+        if host not in host_health :
+            host_health[host] = {
+                'state': 'closed', 'failures': 0, 'opened': 0, 'trial': False
+            }
+        health = host_health[host]
+        if health['state'] == 'open' :
+            if time.monotonic() - health['opened'] >= circuit_open_time :
+                health['state'] = 'half-open'
+                changed = True
+            else :
+                allowed = False
+        if health['state'] == 'half-open' :
+            if health['trial'] :
+                allowed = False
+            else :
+                health['trial'] = True
+    if changed :
+        publish_host_health(host)
+
+    return(allowed)
+
+# ------------------------------------------------------------------------------
+# update the circuit breaker of a host after a request
+#   returns True if the host has recovered from failures
+#
+def circuit_update(host, success) :
+    changed = False
+    recovered = False
+    with health_lock :
+        health = host_health[host]
+        health['trial'] = False
+        if success :
+            recovered = (health['failures'] > 0)
+            health['failures'] = 0
+            if health['state'] != 'closed' :
+                health['state'] = 'closed'
+                changed = True
+                recovered = True
+        else :
+            health['failures'] += 1
+            if (health['state'] == 'half-open') or (
+                (health['state'] == 'closed') and
+                (health['failures'] >= failure_threshold)
+            ) :
+                health['state'] = 'open'
+                health['opened'] = time.monotonic()
+                changed = True
+    if changed :
+        publish_host_health(host)
+
+    return(recovered)
+
+# ------------------------------------------------------------------------------
+# keep a failed request in the spool
+#   only the latest request with the same key is kept
+#
+def spool_request(request) :
+    if spool_file_spec :
+        key = request_key(request)
+        with spool_lock :
+            for item in request_spool :
+                if request_key(item) == key :
+                    request_spool.remove(item)
+                    break
+            item = dict(request)
+            item.pop('trace', None)
+            request_spool.append(item)
+            del request_spool[:-spool_size]
+            write_spool()
+    elif verbose :
+        print(INDENT + "dropped \"%s\"" % request['URL'])
+
+# ------------------------------------------------------------------------------
+# remove the spooled request superseded by a request with the same key
+#
+def unspool_request(request) :
+    if spool_file_spec :
+        key = request_key(request)
+        with spool_lock :
+            for item in request_spool :
+                if request_key(item) == key :
+                    request_spool.remove(item)
+                    write_spool()
+                    break
+
+# ------------------------------------------------------------------------------
+# queue the spooled requests of a host again
+#
+def replay_spool(host) :
+    with spool_lock :
+        replayed = [item for item in request_spool if item['host'] == host]
+        if replayed :
+            request_spool[:] = [
+                item for item in request_spool if item['host'] != host
+            ]
+            write_spool()
+    for item in replayed :
+        if verbose :
+            print(INDENT + "replaying \"%s\"" % item['URL'])
+        queue_request(item)
+
+# ------------------------------------------------------------------------------
+# replay the spool of the given up hosts which are to be tried again
+#   the first replayed request is the trial of the half-open circuit
+#
+def retry_given_up_hosts() :
+    now = time.monotonic()
+    with health_lock :
+        hosts = [
+            host for (host, health) in host_health.items()
+                if (health['state'] == 'open') and
+                    (now - health['opened'] >= circuit_open_time)
+        ]
+    for host in hosts :
+        replay_spool(host)
+
+# ------------------------------------------------------------------------------
+# write and read the spool file
+#
+def write_spool() :
+    spool_file = open(spool_file_spec, 'w')
+    json.dump(request_spool, spool_file)
+    spool_file.close()
+
+def read_spool() :
+    if spool_file_spec and os.path.isfile(spool_file_spec) :
+        try :
+            spool_file = open(spool_file_spec, 'r')
+            request_spool.extend(json.load(spool_file)[-spool_size:])
+            spool_file.close()
+        except ValueError :
+            pass
+
+# ------------------------------------------------------------------------------
+# take the next request of a host which is below its concurrency limit
+#   to be called with the work condition held
+#
+def take_request() :
+    for host in list(host_queues) :
+        if host_active.get(host, 0) < host_concurrency :
+            pending = host_queues.pop(host)
+            request = pending.popleft()
+            if pending :
+                host_queues[host] = pending;  # other hosts come first next time
+            host_active[host] = host_active.get(host, 0) + 1
+            return(request)
+
+    return(None)
+
+# ------------------------------------------------------------------------------
+# send the queued requests
+#
+def request_worker() :
+    while True :
+        with work_condition :
+            request = take_request()
+            while request is None :
+                if end :
+                    return
+                work_condition.wait(1)
+                request = take_request()
+        host = request['host']
+        if serve_from_cache(request, start_flight=True) :
+            pass
+        elif circuit_allows(host) :
+            (response, elapsed_time) = send_request(
+                request['method'], host, request['URL']
+            )
+            if publish_results :
+                publish_result(request, response, elapsed_time)
+            complete_flight(request, response, elapsed_time)
+            if response is None :
+                spool_request(request)
+            else :
+                unspool_request(request)
+            if circuit_update(host, response is not None) :
+                replay_spool(host)
+        else :
+            complete_flight(request, None, 0)
+            spool_request(request)
+        with work_condition :
+            host_active[host] -= 1
+            if host_active[host] == 0 :
+                host_active.pop(host)
+            work_condition.notify_all()
+
 # ------------------------------------------------------------------------------
 # catch ctrl-C interrupt
 #
@@ -93,6 +704,16 @@ if verbose :
     print(INDENT + "class id    : %s" % CLASS_ID)
     print(INDENT + "instance id : %s" % instance_id)
     print()
+                                                   # replay the spooled requests
+read_spool()
+for host in set(item['host'] for item in request_spool) :
+    replay_spool(host)
+                                                         # start request workers
+workers = []
+for index in range(worker_count) :
+    worker = threading.Thread(target=request_worker, daemon=True)
+    worker.start()
+    workers.append(worker)
 
 # ..............................................................................
                                                                   # main loop
@@ -106,6 +727,10 @@ while not end :
         xpl_socket, xpl_id, xpl_ip, client_port,
         heartbeat_interval, last_heartbeat_time
     )
+                                                      # close idle host sessions
+    evict_idle_sessions()
+                                                      # try given up hosts again
+    retry_given_up_hosts()
                                               # get xpl-UDP message with timeout
     (xpl_message, source_address) = common.xpl_get_message(xpl_socket, timeout);
                                                            # process XPL message
@@ -114,7 +739,10 @@ while not end :
             common.xpl_get_message_elements(xpl_message)
         if schema == CLASS_ID + '.basic' :
             if xpl_type == 'xpl-cmnd' :
-                if common.xpl_is_for_me(xpl_id, target) :
+                if common.xpl_is_for_me(xpl_id, target) and \
+                    common.xpl_accept_message(
+                        xpl_socket, xpl_id, xpl_message, source
+                    ) :
                                                                         # method
                     method = 'GET'
                     if 'method' in body.keys() :
@@ -144,6 +772,16 @@ while not end :
                         path = body['path']
                         body.pop('path')
                     request_URL = request_URL + path
+                                                   # value to extract from reply
+                    extract = ''
+                    if 'extract' in body.keys() :
+                        extract = body['extract']
+                        body.pop('extract')
+                                                   # key of superseding requests
+                    coalesce = ''
+                    if 'coalesce' in body.keys() :
+                        coalesce = body['coalesce']
+                        body.pop('coalesce')
                                                                     # parameters
                     parameters = ''
                     if body :
@@ -154,51 +792,18 @@ while not end :
                     request_URL = request_URL + parameters
                     if verbose :
                         print("request \"%s %s\"" % (method, request_URL))
-                                                                           # GET
-                    if method == 'GET' :
-                        try :
-                            request = requests.get(request_URL)
-                        except:
-                            if verbose :
-                                print(
-                                    INDENT +
-                                    "request \"%s\" rejected" % request_URL
-                                )
-                                                                          # POST
-                    elif method == 'POST' :
-                        try :
-#                            request = requests.post(request_URL, data='')
-                            request = requests.post(request_URL)
-                        except:
-                            if verbose :
-                                print(
-                                    INDENT +
-                                    "request \"%s\" rejected" % request_URL
-                                )
-                                                                           # PUT
-                    elif method == 'PUT' :
-                        try :
-                            request = requests.put(request_URL)
-                        except:
-                            if verbose :
-                                print(
-                                    INDENT +
-                                    "request \"%s\" rejected" % request_URL
-                                )
-                                                                        # DELETE
-                    elif method == 'DELETE' :
-                        try :
-                            request = requests.delete(request_URL)
-                        except:
-                            if verbose :
-                                print(
-                                    INDENT +
-                                    "request \"%s\" rejected" % request_URL
-                                )
-                    if verbose :
-                        try :
-                            print(INDENT + requests.reason)
-                        except:
-                            pass
+                                                                  # send request
+                    if method in ['GET', 'POST', 'PUT', 'DELETE'] :
+                        queue_request({
+                            'method': method, 'host': server + port,
+                            'path': path, 'URL': request_URL,
+                            'extract': extract, 'coalesce': coalesce,
+                            'trace': common.xpl_get_message_trace(xpl_message)
+                        })
+                                                     # let the workers terminate
+with work_condition :
+    work_condition.notify_all()
+for worker in workers :
+    worker.join(sum(request_timeout))
                                                              # delete xPL socket
 common.xpl_disconnect(xpl_socket, xpl_id, xpl_ip, client_port)
@@ -2,13 +2,18 @@
 import os
 import time
 import argparse
-import logging
-from logging.handlers import RotatingFileHandler
+import threading
+import queue
+import collections
+import json
+import re
+from urllib.parse import urlsplit, parse_qs
 from http import HTTPStatus
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 import sys
 sys.path.append(sys.path[0]+'/../xPL-base')
 import common
+import logger
 
 # ------------------------------------------------------------------------------
 # constants
@@ -17,6 +22,22 @@ VENDOR_ID = 'dspc';             # from xplproject.org
 DEVICE_ID = 'rest';             # max 8 chars
 CLASS_ID = 'rest';              # max 8 chars
 
+EVENT_HISTORY = 256;            # events kept for clients catching up
+KEEP_ALIVE_PERIOD = 15;         # seconds between event stream comments
+BATCH_MAX_LENGTH = 100;         # operations per batch request
+BODY_MAX_LENGTH = 64*1024;      # bytes of a request body
+CONNECTION_TIMEOUT = 60;        # seconds an idle kept-alive connection stays
+MAXIMAL_WAIT = 60;              # seconds a status request waits for a change
+
+PATH_ELEMENT = '([^/]*)'
+REQUEST_ROUTES = [              # checked in order, the first match wins
+    ('events', re.compile('/events')),
+    ('batch', re.compile('/batch')),
+    ('button', re.compile('/%s/button/%s/%s' % (3*(PATH_ELEMENT,)))),
+    ('status', re.compile('/home' + 3*('/' + PATH_ELEMENT))),
+    ('control', re.compile('/home' + 4*('/' + PATH_ELEMENT))),
+]
+
 INDENT = '  '
 SEPARATOR = 80 * '-'
 
@@ -65,12 +86,61 @@ parser.add_argument(
 parser.add_argument(
     '-l', '--logFile', default='/tmp/xpl-rest.log',
     help = 'log file'
+)
+                                                                 # trace request
+parser.add_argument(
+    '-T', '--trace', action='store_true', dest='trace',
+    help = 'stamp a trace on the xPL messages sent for each request'
 )
                                                                      # verbosity
 parser.add_argument(
     '-v', '--verbose', action='store_true', dest='verbose',
     help = 'verbose console output'
 )
+                                                         # status reply deadline
+parser.add_argument(
+    '-a', '--askTimeout', default=1,
+    help = 'the maximal time to wait for a status reply in seconds'
+)
+                                                          # state cache lifetime
+parser.add_argument(
+    '-c', '--cacheTime', default=30,
+    help = 'the time in seconds a cached state is served without asking'
+)
+                                                           # reliable state sets
+parser.add_argument(
+    '-R', '--reliable', action='store_true', dest='reliable',
+    help = 'retransmit the state set commands until they are acknowledged'
+)
+                                                              # sequence numbers
+parser.add_argument(
+    '-q', '--sequence', action='store_true', dest='sequence',
+    help = 'number the sent messages to allow loss detection'
+)
+                                                      # button coalescing window
+parser.add_argument(
+    '-w', '--buttonWindow', default=0,
+    help = 'the ms within which a repeated button action is dropped (0: none)'
+)
+                                                             # button rate limit
+parser.add_argument(
+    '-b', '--buttonRate', default=0,
+    help = 'the maximal actions per minute and button (0 for no limit)'
+)
+                                                           # per button settings
+parser.add_argument(
+    '-B', '--buttons', default='',
+    help = 'per button window and rate, as "id:window:rate,id:window:rate"'
+)
+                                       # transform button settings to dictionary
+def argument_string_to_button_settings(parameter):
+    settings = {}
+    for button in filter(None, parameter.split(',')) :
+        (button_id, window, rate) = button.rsplit(':', 2)
+        button_id = button_id.replace(':', '').upper()
+        settings[button_id] = (float(window)/1000, float(rate))
+
+    return(settings)
                                                   # parse command line arguments
 parser_arguments = parser.parse_args()
 http_server_port = int(parser_arguments.httpPort)
@@ -80,88 +150,84 @@ heartbeat_interval = int(parser_arguments.timer)
 message_type = parser_arguments.type
 message_source = parser_arguments.source
 message_target = parser_arguments.destination
+if parser_arguments.sequence :
+    common.xpl_enable_sequence_numbers()
 log_file_spec = parser_arguments.logFile
+trace_requests = parser_arguments.trace
+reliable_sets = parser_arguments.reliable
+status_timeout = float(parser_arguments.askTimeout)
+state_cache_time = float(parser_arguments.cacheTime)
+button_window = float(parser_arguments.buttonWindow)/1000
+button_rate = float(parser_arguments.buttonRate)
+button_settings = argument_string_to_button_settings(parser_arguments.buttons)
 verbose = parser_arguments.verbose
 
-# ==============================================================================
-# Internal functions
-#
-
 # ------------------------------------------------------------------------------
-# check if home status request
+# global variables
 #
-def is_home_status_request(path) :
-    is_home_status = False
-    path_elements = path.split('/')
-    if len(path_elements) == 5 :
-        if path_elements[1] == 'home' :
-            is_home_status = True
+end = False
+message_waiters = []
+waiters_lock = threading.Lock()
+pending_sets = {}
+state_cache = {}
+state_lock = threading.Lock()
+state_version = 0
+state_versions = {}
+recent_events = collections.deque(maxlen=EVENT_HISTORY)
+events_condition = threading.Condition()
+button_presses = {}
+button_lock = threading.Lock()
 
-    return(is_home_status)
+# ==============================================================================
+# Internal functions
+#
 
 # ------------------------------------------------------------------------------
-# check if home control request
+# split request path and query parameters
 #
-def is_home_control_request(path) :
-    is_home_control = False
-    path_elements = path.split('/')
-    if len(path_elements) == 6 :
-        if path_elements[1] == 'home' :
-            is_home_control = True
+def split_request(request) :
+    request_parts = urlsplit(request)
+    path = request_parts.path
+    query = parse_qs(request_parts.query)
 
-    return(is_home_control)
+    return(path, query)
 
-# ------------------------------------------------------------------------------
-# get status request
-#
-def get_status_request(path) :
-    path_elements = path.split('/')
-    room = path_elements[2]
-    kind = path_elements[3]
-    obj = path_elements[4]
+def get_query_value(query, name, default=None) :
+    value = default
+    if name in query :
+        value = query[name][0]
 
-    return(room, kind, obj)
+    return(value)
 
 # ------------------------------------------------------------------------------
-# get control action
+# find request route
 #
-def get_control_action(path) :
-    path_elements = path.split('/')
-    room = path_elements[2]
-    kind = path_elements[3]
-    obj = path_elements[4]
-    value = path_elements[5]
+def route_request(path) :
+    route = None
+    parameters = ()
+    for (name, pattern) in REQUEST_ROUTES :
+        match = pattern.fullmatch(path)
+        if match :
+            route = name
+            parameters = match.groups()
+            break
 
-    return(room, kind, obj, value)
+    return(route, parameters)
 
 # ------------------------------------------------------------------------------
-# check if button request
+# start request trace
 #
-def is_button_request(path) :
-    is_button = False
-    path_elements = path.split('/')
-    if len(path_elements) == 5 :
-        if path_elements[2] == 'button' :
-            is_button = True
+def start_request_trace() :
+    trace = None
+    if trace_requests :
+        trace = common.xpl_new_trace()
 
-    return(is_button)
+    return(trace)
 
 # ------------------------------------------------------------------------------
 # send home control xPl message
 #
-def send_control_xPL_message(query, room, kind, obj, value='') :
-                                   # send heartbeat to receive messages from hub
-    last_heartbeat_time = 0;
-    last_heartbeat_time = common.xpl_send_heartbeat(
-        xpl_socket, xpl_id, xpl_ip, client_port,
-        heartbeat_interval, last_heartbeat_time
-    )
-                                                          # clear message buffer
-    buffer_empty = False
-    while not buffer_empty:
-        (message, source) = common.xpl_get_message(xpl_socket, 0.1)
-        if message == '' :
-            buffer_empty = True
+def send_control_xPL_message(query, room, kind, obj, value='', trace=None) :
                                                 # send message to ask for status
     state_message_type = 'xpl-cmnd'
     message_body = {}
@@ -171,50 +237,336 @@ def send_control_xPL_message(query, room, kind, obj, value='') :
     message_body['object']  = obj
     if query == 'set' :
         message_body['value']   = value
-    common.xpl_send_message(
-        xpl_socket, common.XPL_PORT,
-        state_message_type, message_source, message_target, 'state.basic',
-        message_body
-    );
+    if reliable_sets and (query == 'set') :
+        message_id = common.xpl_send_reliable_message(
+            xpl_socket, common.XPL_PORT,
+            state_message_type, message_source, message_target, 'state.basic',
+            message_body, trace
+        )
+        pending_sets[message_id] = "%s %s %s to %s" % (room, kind, obj, value)
+    else :
+        common.xpl_send_message(
+            xpl_socket, common.XPL_PORT,
+            state_message_type, message_source, message_target, 'state.basic',
+            message_body, trace
+        );
+    if query == 'set' :
+        store_state(room, kind, obj, value)
 
 # ------------------------------------------------------------------------------
-# get home control xPl status
+# register and unregister a queue receiving the matching xPL messages
 #
-def get_xPL_status_message() :
-                                                           # read message buffer
-    message = 'hello'
-    while message != '' :
-        (message, source) = common.xpl_get_message(xpl_socket, 1)
-        if message :
-            (
-                xpl_type, source, target, schema, body_dict
-            ) = common.xpl_get_message_elements(message)
-            if (xpl_type == 'xpl-stat') and (schema == 'state.basic') :
-                if 'value' in body_dict :
-                    value = body_dict['value']
+def add_message_waiter(predicate=None) :
+    waiter = queue.Queue()
+    with waiters_lock :
+        message_waiters.append((predicate, waiter))
+
+    return(waiter)
+
+def remove_message_waiter(waiter) :
+    with waiters_lock :
+        for (predicate, registered) in list(message_waiters) :
+            if registered is waiter :
+                message_waiters.remove((predicate, registered))
+
+# ------------------------------------------------------------------------------
+# build a predicate matching the status reply for a given object
+#
+def status_reply_predicate(room, kind, obj) :
+    def is_status_reply(elements) :
+        (xpl_type, source, target, schema, body_dict) = elements
+        return(
+            (xpl_type == 'xpl-stat') and (schema == 'state.basic') and
+            (body_dict.get('room') == room) and
+            (body_dict.get('kind') == kind) and
+            (body_dict.get('object') == obj)
+        )
+
+    return(is_status_reply)
+
+# ------------------------------------------------------------------------------
+# update the state cache from the state messages seen on the bus
+#
+def update_state_cache(elements) :
+    (xpl_type, source, target, schema, body_dict) = elements
+    if schema == 'state.basic' :
+        room = body_dict.get('room')
+        kind = body_dict.get('kind')
+        obj = body_dict.get('object')
+        if room and kind and obj :
+                                                         # store reported values
+            if (xpl_type in ['xpl-stat', 'xpl-trig']) and \
+                ('value' in body_dict) :
+                store_state(room, kind, obj, body_dict['value'])
+                                                    # store the values being set
+            elif (xpl_type == 'xpl-cmnd') and \
+                (body_dict.get('command') in ['set', 'update']) :
+                if body_dict.get('value') :
+                    store_state(room, kind, obj, body_dict['value'])
                 else :
-                    value = 'unknown'
+                    forget_cached_state(room, kind, obj)
+
+def store_state(room, kind, obj, value) :
+    with state_lock :
+        objects = state_cache.setdefault(room, {})
+        objects = objects.setdefault(kind, {})
+        previous = objects.get(obj)
+        objects[obj] = (value, time.monotonic())
+    if (previous is None) or (previous[0] != value) :
+        publish_event(
+            {
+                'type' : 'state', 'room' : room, 'kind' : kind,
+                'object' : obj, 'value' : value
+            },
+            (room, kind, obj)
+        )
+
+# ------------------------------------------------------------------------------
+# publish a state change or button event to the waiting clients
+#
+def publish_event(event, key=None) :
+    global state_version
+    with events_condition :
+        state_version += 1
+        event['version'] = state_version
+        recent_events.append(event)
+        if key :
+            state_versions[key] = state_version
+        events_condition.notify_all()
+
+def publish_button_event(elements) :
+    (xpl_type, source, target, schema, body_dict) = elements
+    if schema == 'button.basic' :
+        publish_event({
+            'type'     : 'button',
+            'hardware' : body_dict.get('hardware', ''),
+            'id'       : body_dict.get('id', ''),
+            'action'   : body_dict.get('action', '')
+        })
+
+# ------------------------------------------------------------------------------
+# wait for events newer than a given version
+#
+def get_events_since(version, timeout) :
+    with events_condition :
+        events_condition.wait_for(lambda : state_version > version, timeout)
+        events = [
+            event for event in recent_events if event['version'] > version
+        ]
+
+    return(events)
+
+def wait_for_state_change(room, kind, obj, version, timeout) :
+    key = (room, kind, obj)
+    with events_condition :
+        if version is None :
+            version = state_versions.get(key, 0)
+        events_condition.wait_for(
+            lambda : state_versions.get(key, 0) > version, timeout
+        )
+        version = state_versions.get(key, 0)
+
+    return(version)
+
+# ------------------------------------------------------------------------------
+# get a fresh value from the state cache
+#
+def get_cached_state(room, kind, obj) :
+    value = None
+    with state_lock :
+        entry = state_cache.get(room, {}).get(kind, {}).get(obj)
+    if entry :
+        (cached_value, update_time) = entry
+        if time.monotonic() - update_time < state_cache_time :
+            value = cached_value
+
+    return(value)
+
+def forget_cached_state(room, kind, obj) :
+    with state_lock :
+        state_cache.get(room, {}).get(kind, {}).pop(obj, None)
+
+# ------------------------------------------------------------------------------
+# hand a received xPL message to the state cache, events and waiters
+#
+def dispatch_xPL_message(message) :
+    elements = common.xpl_get_message_elements(message)
+    (xpl_type, source, target, schema, body_dict) = elements
+    common.xpl_process_acknowledge(xpl_type, schema, body_dict)
+    update_state_cache(elements)
+    publish_button_event(elements)
+    with waiters_lock :
+        waiters = list(message_waiters)
+    for (predicate, waiter) in waiters :
+        if (predicate is None) or predicate(elements) :
+            waiter.put(elements)
+
+# ------------------------------------------------------------------------------
+# receive xPL messages and route them to the waiting requests
+#
+def receive_xPL_messages() :
+    last_heartbeat_time = 0;
+    while not end :
+                                   # send heartbeat to receive messages from hub
+        last_heartbeat_time = common.xpl_send_heartbeat(
+            xpl_socket, xpl_id, xpl_ip, client_port,
+            heartbeat_interval, last_heartbeat_time
+        )
+                                              # get xpl-UDP message with timeout
+        timeout = common.xpl_next_retransmit_timeout(1)
+        (message, source_address) = common.xpl_get_message(xpl_socket, timeout)
+        if message :
+            try :
+                dispatch_xPL_message(message)
+            except Exception as error :
+                request_log.error(
+                    "skipped xPL message %r: %r" % (message, error)
+                )
+                                                      # retransmit reliable sets
+        for message_id in common.xpl_retransmit_pending(xpl_socket) :
+            request_log.warning(
+                "setting %s was not acknowledged" % pending_sets.pop(message_id)
+            )
+        for message_id in list(pending_sets) :
+            if not common.xpl_is_pending(message_id) :
+                pending_sets.pop(message_id, None)
+
+# ------------------------------------------------------------------------------
+# get home control xPl status
+#
+def get_xPL_status_message(waiter, timeout=None) :
+                                                   # wait for the matching reply
+    if timeout is None :
+        timeout = status_timeout
+    value = 'unknown'
+    try :
+        elements = waiter.get(timeout=timeout)
+        (xpl_type, source, target, schema, body_dict) = elements
+        if 'value' in body_dict :
+            value = body_dict['value']
+    except queue.Empty :
+        pass
+
+    return(value)
+
+# ------------------------------------------------------------------------------
+# get home state from the cache or else from the bus
+#
+def ask_home_status(room, kind, obj, trace=None) :
+    waiter = None
+    value = get_cached_state(room, kind, obj)
+    if value is None :
+        waiter = add_message_waiter(status_reply_predicate(room, kind, obj))
+        send_control_xPL_message('ask', room, kind, obj, trace=trace)
+
+    return(value, waiter)
+
+def get_home_status(room, kind, obj, trace=None) :
+    (value, waiter) = ask_home_status(room, kind, obj, trace)
+    if waiter :
+        value = get_xPL_status_message(waiter)
+        remove_message_waiter(waiter)
 
     return(value)
 
 # ------------------------------------------------------------------------------
-# get button action
+# run a list of set and ask operations
 #
-def get_button_action(path) :
-    button_brand = ''
-    button_id = ''
-    button_action = ''
-    path_elements = path.split('/')
-    button_brand = path_elements[1]
-    button_id = path_elements[3]
-    button_action = path_elements[4]
+def run_batch(operations, trace=None) :
+    results = []
+    waiters = []
+                                                    # send sets and asks at once
+    for operation in operations :
+        result = {}
+        for item in ['op', 'room', 'kind', 'object', 'value'] :
+            if item in operation :
+                result[item] = str(operation[item])
+        results.append(result)
+        if not all(result.get(item) for item in ['room', 'kind', 'object']) :
+            result['status'] = 'missing room, kind or object'
+        elif (result.get('op') == 'set') and ('value' in result) :
+            send_control_xPL_message(
+                'set', result['room'], result['kind'], result['object'],
+                result['value'], trace
+            )
+            result['status'] = 'sent'
+        elif result.get('op') == 'ask' :
+            (value, waiter) = ask_home_status(
+                result['room'], result['kind'], result['object'], trace
+            )
+            if waiter :
+                waiters.append((result, waiter))
+            else :
+                result['value'] = value
+                result['status'] = 'cached'
+        else :
+            result['status'] = 'invalid operation'
+                                                    # collect the status replies
+    deadline = time.monotonic() + status_timeout
+    for (result, waiter) in waiters :
+        result['value'] = get_xPL_status_message(
+            waiter, max(deadline - time.monotonic(), 0)
+        )
+        remove_message_waiter(waiter)
+        result['status'] = 'replied'
+        if result['value'] == 'unknown' :
+            result['status'] = 'timeout'
 
-    return(button_brand, button_id, button_action)
+    return(results)
+
+# ------------------------------------------------------------------------------
+# coalesce repeated button actions and limit their rate
+#   returns why the action is dropped, or an empty string to send it
+#
+def filter_button_action(button_brand, button_id, button_action) :
+    button_id = button_id.replace(':', '').upper()
+    (window, rate) = button_settings.get(
+        button_id, (button_window, button_rate)
+    )
+    now = time.monotonic()
+    with button_lock :
+        key = (button_brand, button_id)
+        if key not in button_presses :
+            button_presses[key] = {
+                'action': '', 'sent': 0, 'tokens': rate, 'time': now,
+                'coalesced': 0, 'limited': 0
+            }
+        press = button_presses[key]
+                                           # refill the tokens of the rate limit
+        press['tokens'] = min(
+            rate, press['tokens'] + (now - press['time'])*rate/60
+        )
+        press['time'] = now
+                                                     # check for repeated action
+        dropped = ''
+        if (button_action == press['action']) and \
+            (now - press['sent'] < window) :
+            dropped = 'coalesced'
+        elif rate > 0 :
+            if press['tokens'] < 1 :
+                dropped = 'limited'
+            else :
+                press['tokens'] -= 1
+        if dropped :
+            press[dropped] += 1
+            count = press[dropped]
+        else :
+            press['action'] = button_action
+            press['sent'] = now
+    if dropped :
+        request_log.info(
+            "button %s %s %s %s (%d so far)"
+            % (button_brand, button_id, button_action, dropped, count)
+        )
+
+    return(dropped)
 
 # ------------------------------------------------------------------------------
 # send button xPl message
 #
-def send_button_xPL_message(button_brand, button_id, button_action) :
+def send_button_xPL_message(
+    button_brand, button_id, button_action, trace=None
+) :
     message_body = {}
     message_body['hardware'] = button_brand
     message_body['id'] = button_id.replace(':', '').upper()
@@ -223,7 +575,7 @@ def send_button_xPL_message(button_brand, button_id, button_action) :
     common.xpl_send_message(
         xpl_socket, common.XPL_PORT,
         message_type, message_source, message_target, 'button.basic',
-        message_body
+        message_body, trace
     );
 
 # ------------------------------------------------------------------------------
@@ -251,91 +603,247 @@ def build_HTML_reply(path, info) :
 # HTTP methods
 #
 class http_server(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    timeout = CONNECTION_TIMEOUT
+    disable_nagle_algorithm = True
                                                                            # GET
     def do_GET(self):
         client = self.client_address[0]
-        path = self.path
-        logging.info(client + ' GET ' + path)
-        if is_button_request(path) :
-            (button_brand, button_id, button_action) = get_button_action(path)
+        (path, query) = split_request(self.path)
+        (route, parameters) = route_request(path)
+        trace = start_request_trace()
+        request_log.info(client + ' GET ' + self.path)
+        if route == 'events' :
+            self.send_events(query)
+        elif route == 'button' :
+            (button_brand, button_id, button_action) = parameters
+            dropped = filter_button_action(
+                button_brand, button_id, button_action
+            )
             info = "On <code>%s</code> " % button_brand
             info += "button <code>%s</code>, " % button_id
             info += "action was <code>%s</code>" % button_action
-            self.send_reply(info=info, code=HTTPStatus.OK)
-            send_button_xPL_message(button_brand, button_id, button_action)
-        elif is_home_status_request(path) :
-            (room, kind, obj) = get_status_request(path)
-            send_control_xPL_message('ask', room, kind, obj)
-            value = get_xPL_status_message()
+            if dropped :
+                info += " (%s)" % dropped
+            self.send_reply(
+                info=info, code=HTTPStatus.OK,
+                data={
+                    'hardware': button_brand,
+                    'id': button_id, 'action': button_action,
+                    'dropped': dropped
+                }
+            )
+            if not dropped :
+                send_button_xPL_message(
+                    button_brand, button_id, button_action, trace
+                )
+        elif route == 'status' :
+            (room, kind, obj) = parameters
+            try :
+                wait_time = float(get_query_value(query, 'wait', 0))
+                if not (wait_time >= 0) :
+                    raise ValueError
+                wait_time = min(wait_time, MAXIMAL_WAIT)
+                version = get_query_value(query, 'since')
+                if version is not None :
+                    version = int(version)
+            except ValueError :
+                self.send_reply(code=HTTPStatus.BAD_REQUEST)
+                return
+            if wait_time > 0 :
+                version = wait_for_state_change(
+                    room, kind, obj, version, wait_time
+                )
+            value = get_home_status(room, kind, obj, trace)
             info = "As to the %s %s, " % (room, kind)
             info += "the value of \"%s\" is \"%s\"" % (obj, value)
-            self.send_reply(info=info, code=HTTPStatus.OK)
-        elif is_home_control_request(path) :
-            (room, kind, obj, value) = get_control_action(path)
+            self.send_reply(
+                info=info, code=HTTPStatus.OK, version=version,
+                data={'room': room, 'kind': kind, 'object': obj, 'value': value}
+            )
+        elif route == 'control' :
+            (room, kind, obj, value) = parameters
             info = "For the %s %s, " % (room, kind)
             info += "setting \"%s\" to \"%s\"" % (obj, value)
-            self.send_reply(info=info, code=HTTPStatus.OK)
-            send_control_xPL_message('set', room, kind, obj, value)
+            self.send_reply(
+                info=info, code=HTTPStatus.OK,
+                data={'room': room, 'kind': kind, 'object': obj, 'value': value}
+            )
+            send_control_xPL_message('set', room, kind, obj, value, trace)
         else :
             self.send_reply(code=HTTPStatus.NOT_FOUND)
                                                                           # POST
     def do_POST(self):
         client = self.client_address[0]
-        path = self.path
-        logging.info(client + ' POST ' + path)
-        if is_button_request(path) :
-            (button_brand, button_id, button_action) = get_button_action(path)
-            if button_id :
-                self.send_reply(code=HTTPStatus.OK)
-                send_button_xPL_message(button_brand, button_id, button_action)
-            else :
+        (path, query) = split_request(self.path)
+        (route, parameters) = route_request(path)
+        trace = start_request_trace()
+        request_log.info(client + ' POST ' + self.path)
+        body = self.read_body()
+        if body is None :
+            return
+        if route == 'batch' :
+            try :
+                operations = json.loads(body)
+                if (not isinstance(operations, list)) or \
+                    (len(operations) > BATCH_MAX_LENGTH) or \
+                    (not all(isinstance(item, dict) for item in operations)) :
+                    raise ValueError
+            except ValueError :
                 self.send_reply(code=HTTPStatus.BAD_REQUEST)
+                return
+            self.send_json_reply(run_batch(operations, trace))
+        elif route == 'button' :
+            self.send_button_reply(parameters, trace)
         else :
             self.send_reply(code=HTTPStatus.NOT_FOUND)
                                                                            # PUT
     def do_PUT(self):
         client = self.client_address[0]
-        path = self.path
-        logging.info(client + ' PUT ' + path)
-        if is_button_request(path) :
-            (button_brand, button_id, button_action) = get_button_action(path)
-            if button_id :
-                self.send_reply(code=HTTPStatus.OK)
-                send_button_xPL_message(button_brand, button_id, button_action)
-            else :
-                self.send_reply(code=HTTPStatus.BAD_REQUEST)
-        elif is_home_control_request(path) :
-            (room, kind, obj, value) = get_control_action(path)
+        (path, query) = split_request(self.path)
+        (route, parameters) = route_request(path)
+        trace = start_request_trace()
+        request_log.info(client + ' PUT ' + self.path)
+        if self.read_body() is None :
+            return
+        if route == 'button' :
+            self.send_button_reply(parameters, trace)
+        elif route == 'control' :
+            (room, kind, obj, value) = parameters
             info = "For the %s %s, " % (room, kind)
             info += "setting \"%s\" to \"%s\"" % (obj, value)
-            self.send_reply(info=info, code=HTTPStatus.OK)
-            send_control_xPL_message('set', room, kind, obj, value)
+            self.send_reply(
+                info=info, code=HTTPStatus.OK,
+                data={'room': room, 'kind': kind, 'object': obj, 'value': value}
+            )
+            send_control_xPL_message('set', room, kind, obj, value, trace)
         else :
             self.send_reply(code=HTTPStatus.NOT_FOUND)
                                                                          # PATCH
     def do_PATCH(self):
         client = self.client_address[0]
         path = self.path
-        logging.info(client + ' PATCH ' + path)
+        request_log.info(client + ' PATCH ' + path)
+        if self.read_body() is None :
+            return
         print('patch:/' + path)
         self.send_reply()
                                                                         # DELETE
     def do_DELETE(self):
         client = self.client_address[0]
         path = self.path
-        logging.info(client + ' DELETE ' + path)
+        request_log.info(client + ' DELETE ' + path)
+        if self.read_body() is None :
+            return
         print('delete:/' + path)
         self.send_reply()
+                                                                  # request body
+    def read_body(self):
+        body = None
+        try :
+            length = int(self.headers.get('Content-Length', 0))
+            if length < 0 :
+                raise ValueError
+        except ValueError :
+            length = None
+        if length is None :
+            self.close_connection = True
+            self.send_reply(code=HTTPStatus.BAD_REQUEST)
+        elif length > BODY_MAX_LENGTH :
+            self.close_connection = True
+            self.send_reply(code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        else :
+            body = self.rfile.read(length)
+
+        return(body)
+                                                                  # reply format
+    def wants_json(self):
+        accept = self.headers.get('Accept', '')
+
+        return('application/json' in accept)
+                                                                 # button action
+    def send_button_reply(self, parameters, trace=None):
+        (button_brand, button_id, button_action) = parameters
+        if button_id :
+            dropped = filter_button_action(
+                button_brand, button_id, button_action
+            )
+            self.send_reply(
+                code=HTTPStatus.OK,
+                data={
+                    'hardware': button_brand,
+                    'id': button_id, 'action': button_action,
+                    'dropped': dropped
+                }
+            )
+            if not dropped :
+                send_button_xPL_message(
+                    button_brand, button_id, button_action, trace
+                )
+        else :
+            self.send_reply(code=HTTPStatus.BAD_REQUEST)
                                                                  # HTML response
-    def send_reply(self, info='', code=HTTPStatus.OK):
+    def send_reply(self, info='', code=HTTPStatus.OK, version=None, data=None):
         path = self.path
-        if code == HTTPStatus.OK :
+        if self.wants_json() :
+            reply = {'request': path}
+            if code == HTTPStatus.OK :
+                reply.update(data or {})
+                if version is not None :
+                    reply['version'] = version
+            else :
+                reply['error'] = code.phrase
+            self.send_json_reply(reply, code)
+        elif code == HTTPStatus.OK :
+            reply = build_HTML_reply(path, info).encode("ascii")
             self.send_response(code)
             self.send_header('Content-type', 'text/html')
+            self.send_header('Content-Length', "%d" % len(reply))
+            if version is not None :
+                self.send_header('X-State-Version', "%d" % version)
             self.end_headers()
-            self.wfile.write(build_HTML_reply(path, info).encode("ascii"))
+            self.wfile.write(reply)
         else :
             self.send_error(code, explain="Path was \"%s\"" % path)
+                                                                 # JSON response
+    def send_json_reply(self, data, code=HTTPStatus.OK):
+        reply = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', "%d" % len(reply))
+        self.end_headers()
+        self.wfile.write(reply)
+                                                            # server-sent events
+    def send_events(self, query):
+        version = self.headers.get('Last-Event-ID')
+        if version is None :
+            version = get_query_value(query, 'since', state_version)
+        try :
+            version = int(version)
+        except ValueError :
+            self.send_reply(code=HTTPStatus.BAD_REQUEST)
+            return
+        self.close_connection = True
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        try :
+            while not end :
+                events = get_events_since(version, KEEP_ALIVE_PERIOD)
+                stream = ''
+                for event in events :
+                    stream += "id: %d\n" % event['version']
+                    stream += "event: %s\n" % event['type']
+                    stream += "data: %s\n\n" % json.dumps(event)
+                    version = event['version']
+                if not events :
+                    stream = ": keep-alive\n\n"
+                self.wfile.write(stream.encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError) :
+            pass
 
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -346,6 +854,7 @@ class http_server(SimpleHTTPRequestHandler):
 
     def do_OPTIONS(self):
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
 # ==============================================================================
@@ -356,18 +865,7 @@ try:
     os.remove(log_file_spec)
 except OSError:
     pass
-logging.basicConfig(
-    handlers = [
-        RotatingFileHandler(
-            log_file_spec,
-            maxBytes = 100*80,
-            backupCount = 1
-        )
-    ],
-    level = logging.INFO,
-    format = '%(asctime)s %(levelname)s %(message)s',
-    datefmt = '%Y-%m-%d %H:%M:%S'
-)
+request_log = logger.log_open('xpl-rest', log_file_spec)
                                                              # create xPL socket
 xpl_id = common.xpl_build_id(VENDOR_ID, DEVICE_ID, instance_id);
 xpl_ip = common.xpl_find_ip()
@@ -378,10 +876,17 @@ if verbose :
     os.system('clear||cls')
     print(SEPARATOR)
     print(INDENT + "Started UDP socket on port %s" % client_port)
+                                                            # start xPL receiver
+receiver = threading.Thread(target=receive_xPL_messages, daemon=True)
+receiver.start()
                                                              # start HTML server
-server = HTTPServer(('', http_server_port), http_server)
-logging.info('Starting xPL REST server')
+server = ThreadingHTTPServer(('', http_server_port), http_server)
+request_log.info('Starting xPL REST server')
 try:
     server.serve_forever()
 except KeyboardInterrupt:
     server.server_close()
+end = True
+receiver.join()
+                                                             # delete xPL socket
+common.xpl_disconnect(xpl_socket, xpl_id, xpl_ip, client_port)
@@ -95,6 +95,11 @@ parser.add_argument(
 parser.add_argument(
     '-v', '--verbose', action='store_true', dest='verbose',
     help = 'verbose console output'
+)
+                                                              # sequence numbers
+parser.add_argument(
+    '-q', '--sequence', action='store_true', dest='sequence',
+    help = 'number the sent messages to allow loss detection'
 )
                                                   # parse command line arguments
 parser_arguments = parser.parse_args()
@@ -110,6 +115,8 @@ Ethernet_base_port = parser_arguments.port
 instance_id = parser_arguments.id
 heartbeat_interval = int(parser_arguments.timer)
 startup_delay = int(parser_arguments.wait)
+if parser_arguments.sequence :
+    common.xpl_enable_sequence_numbers()
 verbose = parser_arguments.verbose
 
 # ==============================================================================
@@ -368,7 +375,7 @@ while not end :
                 common.xpl_send_message(
                     xpl_socket, common.XPL_PORT,
                     message_type, message_source, message_target, message_class,
-                    message_body
+                    message_body, common.xpl_get_message_trace(xpl_message)
                 );
 
                                                              # delete xPL socket
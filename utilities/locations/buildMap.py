@@ -98,22 +98,28 @@ def read_log(log_file_spec):
     latitudes = np.array([])
     longitudes = np.array([])
     altitudes = np.array([])
-    log_file = open(log_file_spec, 'r')
-    for line in log_file :
-        line = line.rstrip("\r\n")
-#        print(line)
-        parameters = line.split(',')
-        for parameter in parameters :
-            (name, value) = parameter.split(':', 1)
-            name = name.strip()
-            if name.lower() == 'time' :
-                time = np.append(time, value)
-            elif name.lower() == 'longitude' :
-                longitudes = np.append(longitudes, float(value))
-            elif name.lower() == 'latitude' :
-                latitudes = np.append(latitudes, float(value))
-            elif name.lower() == 'altitude' :
-                altitudes = np.append(altitudes, float(value))
+                                                 # rolled over points come first
+    log_file_specs = [log_file_spec]
+    if os.path.isfile(log_file_spec + '.1') :
+        log_file_specs.insert(0, log_file_spec + '.1')
+    for file_spec in log_file_specs :
+        log_file = open(file_spec, 'r')
+        for line in log_file :
+            line = line.rstrip("\r\n")
+#            print(line)
+            parameters = line.split(',')
+            for parameter in parameters :
+                (name, value) = parameter.split(':', 1)
+                name = name.strip()
+                if name.lower() == 'time' :
+                    time = np.append(time, value)
+                elif name.lower() == 'longitude' :
+                    longitudes = np.append(longitudes, float(value))
+                elif name.lower() == 'latitude' :
+                    latitudes = np.append(latitudes, float(value))
+                elif name.lower() == 'altitude' :
+                    altitudes = np.append(altitudes, float(value))
+        log_file.close()
 
     return(time, longitudes, latitudes, altitudes)
 
@@ -141,7 +141,10 @@ while not end :
             common.xpl_get_message_elements(xpl_message)
         if schema == CLASS_ID + '.basic' :
             if xpl_type == 'xpl-cmnd' :
-                if common.xpl_is_for_me(xpl_id, target) :
+                if common.xpl_is_for_me(xpl_id, target) and \
+                    common.xpl_accept_message(
+                        xpl_socket, xpl_id, xpl_message, source
+                    ) :
                                                                        # outputs
                     output_id = 0
                     if 'led' in body :
@@ -174,7 +177,8 @@ while not end :
                             xpl_socket, common.XPL_PORT,
                             'xpl-stat', message_source,
                             message_target, message_class,
-                            {'led': output_id, 'value': GPIO_value}
+                            {'led': output_id, 'value': GPIO_value},
+                            common.xpl_get_message_trace(xpl_message)
                         );
                                                                         # inputs
     GPIO_input_values = {}
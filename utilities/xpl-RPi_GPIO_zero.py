@@ -148,7 +148,10 @@ while not end :
             common.xpl_get_message_elements(xpl_message)
         if schema == CLASS_ID + '.basic' :
             if xpl_type == 'xpl-cmnd' :
-                if common.xpl_is_for_me(xpl_id, target) :
+                if common.xpl_is_for_me(xpl_id, target) and \
+                    common.xpl_accept_message(
+                        xpl_socket, xpl_id, xpl_message, source
+                    ) :
                                                                           # LEDs
                     if 'led' in body :
                         LED_id = int(body['led'])
@@ -185,7 +188,8 @@ while not end :
                                     xpl_socket, common.XPL_PORT,
                                     'xpl-stat', message_source,
                                     message_target, message_class,
-                                    {'led': LED_id, 'value': LED_value}
+                                    {'led': LED_id, 'value': LED_value},
+                                    common.xpl_get_message_trace(xpl_message)
                                 );
                                                                        # buttons
     for index in range(len(gp_inputs)) :
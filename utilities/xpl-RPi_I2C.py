@@ -167,7 +167,8 @@ while not end :
                                 'chip'    : chip_address,
                                 'register': register_address,
                                 'data'    : register_data
-                            }
+                            },
+                            common.xpl_get_message_trace(xpl_message)
                         );
                                                                      # write I2C
                     else :
@@ -4,9 +4,12 @@ import sys
 import signal
 import os
 import time
+import subprocess
+import threading
 from datetime import datetime
 sys.path.append(sys.path[0]+'/../xPL-base')
 import common
+import logger
 
 # ------------------------------------------------------------------------------
 # constants
@@ -15,7 +18,7 @@ VENDOR_ID = 'dspc';             # from xplproject.org
 DEVICE_ID = 'actions';          # max 8 chars
 CLASS_ID = 'actions';           # max 8 chars
 
-LOG_FILE_LENGTH = 100
+LOG_FILE_SIZE = 100*80;         # about 100 lines
 
 INDENT = '  '
 SEPARATOR = 80 * '-'
@@ -96,23 +99,26 @@ def execute_command(command, body) :
         full_action = action + arguments
         if verbose :
             print(INDENT + "Received command: \"%s\"\n" % full_command);
-                                                         # limit log file length
-        if os.path.isfile(log_file_spec) :
-            log_file_lines = open(log_file_spec, "r").read().split("\n")
-            log_file_lines.extend(['', "%s :" % full_command, '', ''])
-            open(log_file_spec, "w").write(
-                "\n".join(log_file_lines[-LOG_FILE_LENGTH:])
-            )
                                                                # execute command
         time_stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         print(time_stamp)
         print(type(time_stamp))
-        log_file = open(log_file_spec, 'a')
-        log_file.write(SEPARATOR2)
-        log_file.write("\n%s\n" % time_stamp)
-        log_file.write("%s\n" % full_action)
-        log_file.close()
-        os.system("%s >> %s &" % (full_action, log_file_spec))
+        action_log.info("%s\n%s\n%s" % (SEPARATOR2, time_stamp, full_action))
+        process = subprocess.Popen(
+            full_action, shell=True, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        )
+        threading.Thread(
+            target=log_command_output, args=(process,), daemon=True
+        ).start()
+
+#-------------------------------------------------------------------------------
+# Log the output of a command as it runs
+#
+def log_command_output(process) :
+    for line in process.stdout :
+        action_log.info(line.decode(errors='replace').rstrip('\n'))
+    process.wait()
 
 # ------------------------------------------------------------------------------
 # catch ctrl-C interrupt
@@ -131,6 +137,10 @@ signal.signal(signal.SIGINT, ctrl_C_handler)
 #
                                                                  # startup delay
 time.sleep(startup_delay);
+                                                                 # setup logging
+action_log = logger.log_open(
+    'xpl-actions', log_file_spec, max_bytes=LOG_FILE_SIZE, format='%(message)s'
+)
                                                                 # xPL parameters
 xpl_id = common.xpl_build_id(VENDOR_ID, DEVICE_ID, instance_id);
 xpl_ip = common.xpl_find_ip()
@@ -0,0 +1,377 @@
+#!/usr/bin/python3
+import argparse
+import sys
+import signal
+import os
+import time
+import calendar
+import heapq
+from datetime import date, timedelta
+import numpy as np
+sys.path.append(sys.path[0]+'/../xPL-base')
+import common
+import logger
+
+# ------------------------------------------------------------------------------
+# constants
+#
+VENDOR_ID = 'dspc';             # from xplproject.org
+DEVICE_ID = 'dawnDusk';         # max 8 chars
+CLASS_ID = 'dawnDusk';          # max 8 chars
+
+SUNRISE_ZENITH = 90.833;        # degrees, with refraction and sun radius
+CIVIL_ZENITH = 96
+NAUTICAL_ZENITH = 102
+TABLE_COLUMNS = [               # the yearly table holds one row per day
+    'declination', 'equationOfTime',
+    'dawn', 'nauticalDawn', 'civilDawn', 'sunrise',
+    'sunset', 'civilDusk', 'nauticalDusk', 'dusk'
+]
+MAXIMAL_SLEEP = 10;             # seconds between heartbeat checks
+
+INDENT = '  '
+SEPARATOR = 80 * '-'
+
+# ------------------------------------------------------------------------------
+# command line arguments
+#
+parser = argparse.ArgumentParser()
+                                                                     # verbosity
+parser.add_argument(
+    '-v', '--verbose', action='store_true', dest='verbose',
+    help = 'verbose console output'
+)
+                                                                 # Ethernet port
+parser.add_argument(
+    '-p', '--port', default=50000,
+    help = 'the clients base UDP port'
+)
+                                                                   # instance id
+parser.add_argument(
+    '-n', '--id', default=common.xpl_build_automatic_instance_id(),
+    help = 'the instance id (max. 16 chars)'
+)
+                                                               # heartbeat timer
+parser.add_argument(
+    '-t', '--timer', default=5,
+    help = 'the heartbeat interval in minutes'
+)
+                                                                 # startup delay
+parser.add_argument(
+    '-w', '--wait', default=0,
+    help = 'the startup sleep interval in seconds'
+)
+                                                                      # latitude
+parser.add_argument(
+    '-l', '--latitude', default=46.0037,
+    help = 'the local latitude in degrees'
+)
+                                                                     # longitude
+parser.add_argument(
+    '-g', '--longitude', default=7.3191,
+    help = 'the local longitude (east of Greenwich) in degrees'
+)
+                                                               # twilight offset
+parser.add_argument(
+    '-o', '--offset', default=18,
+    help = 'the twilight offset of dawn and dusk in degrees below the horizon'
+)
+                                                                 # sent triggers
+parser.add_argument(
+    '-e', '--events', default='dawn,sunrise,sunset,dusk',
+    help = 'the events sent as triggers, among ' + ', '.join(TABLE_COLUMNS[2:])
+)
+                                                            # yearly table cache
+parser.add_argument(
+    '-c', '--cache', default='/tmp/xpl-dawnDusk.npz',
+    help = 'the file caching the yearly table of sun times'
+)
+                                                                      # log file
+parser.add_argument(
+    '-d', '--logFile', default='',
+    help = 'the log file of the sent messages (none if empty)'
+)
+                                                  # parse command line arguments
+parser_arguments = parser.parse_args()
+verbose = parser_arguments.verbose
+Ethernet_base_port = int(parser_arguments.port)
+instance_id = parser_arguments.id
+heartbeat_interval = int(parser_arguments.timer)
+startup_delay = int(parser_arguments.wait)
+latitude = float(parser_arguments.latitude)
+longitude = float(parser_arguments.longitude)
+twilight_offset = float(parser_arguments.offset)
+trigger_events = parser_arguments.events.split(',')
+table_file_spec = parser_arguments.cache
+log_file_spec = parser_arguments.logFile
+
+debug = False
+
+# ------------------------------------------------------------------------------
+# global variables
+#
+sun_table = None
+sun_table_year = None
+
+# ==============================================================================
+# Internal functions
+#
+
+#-------------------------------------------------------------------------------
+# Calculate the sun times of all days of a year, in minutes after UTC midnight
+#   NOAA general solar position formulas, evaluated at noon of each day
+#   the days where the sun doesn't reach a zenith angle get NaN
+#
+def build_sun_table(year) :
+    day_count = 365 + calendar.isleap(year)
+    fractional_year = 2*np.pi/day_count * np.arange(day_count)
+                                                  # equation of time, in minutes
+    equation_of_time = 229.18 * (
+        0.000075
+        + 0.001868*np.cos(fractional_year) - 0.032077*np.sin(fractional_year)
+        - 0.014615*np.cos(2*fractional_year)
+        - 0.040849*np.sin(2*fractional_year)
+    )
+                                                       # declination, in radians
+    declination = (
+        0.006918
+        - 0.399912*np.cos(fractional_year) + 0.070257*np.sin(fractional_year)
+        - 0.006758*np.cos(2*fractional_year)
+        + 0.000907*np.sin(2*fractional_year)
+        - 0.002697*np.cos(3*fractional_year)
+        + 0.00148*np.sin(3*fractional_year)
+    )
+    latitude_radians = np.radians(latitude)
+    solar_noon = 720 - 4*longitude - equation_of_time
+                                      # hour angle of a zenith angle, in minutes
+    def zenith_time_offset(zenith) :
+        cosine = np.cos(np.radians(zenith)) / (
+            np.cos(latitude_radians) * np.cos(declination)
+        ) - np.tan(latitude_radians) * np.tan(declination)
+        cosine[np.abs(cosine) > 1] = np.nan
+        return(4*np.degrees(np.arccos(cosine)))
+                                                                   # build table
+    columns = {
+        'declination'    : np.degrees(declination),
+        'equationOfTime' : equation_of_time
+    }
+    for (rising, setting, zenith) in [
+        ('dawn', 'dusk', 90 + twilight_offset),
+        ('nauticalDawn', 'nauticalDusk', NAUTICAL_ZENITH),
+        ('civilDawn', 'civilDusk', CIVIL_ZENITH),
+        ('sunrise', 'sunset', SUNRISE_ZENITH)
+    ] :
+        offset = zenith_time_offset(zenith)
+        columns[rising] = solar_noon - offset
+        columns[setting] = solar_noon + offset
+
+    return(np.column_stack([columns[name] for name in TABLE_COLUMNS]))
+
+#-------------------------------------------------------------------------------
+# Get the sun times of a year, from the cache file if it matches
+#
+def load_sun_table(year) :
+    parameters = np.array([year, latitude, longitude, twilight_offset])
+    table = None
+    if os.path.isfile(table_file_spec) :
+        try :
+            cache = np.load(table_file_spec)
+            if np.array_equal(cache['parameters'], parameters) :
+                table = cache['table']
+        except (OSError, ValueError, KeyError) :
+            pass
+    if table is None :
+        if verbose :
+            print(INDENT + "calculating the sun times of %d" % year)
+        table = build_sun_table(year)
+        try :
+                                         # a file name would get ".npz" appended
+            table_file = open(table_file_spec, 'wb')
+            np.savez(table_file, table=table, parameters=parameters)
+            table_file.close()
+        except OSError :
+            pass
+
+    return(table)
+
+#-------------------------------------------------------------------------------
+# Get the sun times of a day
+#
+def get_sun_times(day) :
+    global sun_table, sun_table_year
+
+    if day.year != sun_table_year :
+        sun_table = load_sun_table(day.year)
+        sun_table_year = day.year
+    row = sun_table[day.timetuple().tm_yday - 1]
+
+    return(dict(zip(TABLE_COLUMNS, row)))
+
+#-------------------------------------------------------------------------------
+# Get the epoch time of a sun event, None if there is none that day
+#
+def get_event_time(day, minutes) :
+    event_time = None
+    if not np.isnan(minutes) :
+        event_time = calendar.timegm(day.timetuple()) + 60*minutes
+
+    return(event_time)
+
+#-------------------------------------------------------------------------------
+# Queue the triggers of a day which are still to come
+#
+def schedule_day(event_queue, day) :
+    sun_times = get_sun_times(day)
+    now = time.time()
+    for event in trigger_events :
+        event_time = get_event_time(day, sun_times[event])
+        if (event_time is not None) and (event_time > now) :
+            heapq.heappush(event_queue, (event_time, event))
+
+#-------------------------------------------------------------------------------
+# Format an event time as local time
+#
+def format_event_time(day, minutes) :
+    event_time = get_event_time(day, minutes)
+    formatted = ''
+    if event_time is not None :
+        formatted = time.strftime('%Hh%M', time.localtime(event_time))
+
+    return(formatted)
+
+#-------------------------------------------------------------------------------
+# Get the true solar time in hours
+#
+def get_solar_time(now, sun_times) :
+    minutes = (now % 86400) / 60 + sun_times['equationOfTime'] + 4*longitude
+
+    return((minutes % 1440) / 60)
+
+#-------------------------------------------------------------------------------
+# Build sun times status response
+#
+def build_times_status(query, day) :
+    sun_times = get_sun_times(day)
+    status = {}
+    status['solarTime'] = "%.2f" % get_solar_time(
+        time.time(), get_sun_times(date.today())
+    )
+    if query in ['declination', 'all'] :
+        status['declination'] = "%.2f" % sun_times['declination']
+    for event in TABLE_COLUMNS[2:] :
+        if query in [event, 'all'] :
+            status[event] = format_event_time(day, sun_times[event])
+    if verbose :
+        for (name, value) in status.items() :
+            print(INDENT + "%-12s: %s" % (name, value))
+
+    return(status)
+
+#-------------------------------------------------------------------------------
+# Log and send xPL message
+#
+def send_message_with_log(xpl_type, target, xpl_class, body) :
+    if log_file_spec :
+        message_log.info(''.join(
+            ", %s = %s" % (item, value) for (item, value) in body.items()
+        ))
+    common.xpl_send_message(
+        xpl_socket, common.XPL_PORT,
+        xpl_type, xpl_id, target, xpl_class,
+        body
+    );
+
+# ------------------------------------------------------------------------------
+# catch ctrl-C interrupt
+#
+end = False
+
+def ctrl_C_handler(sig, frame):
+    global end
+    end = True
+    print('')
+
+signal.signal(signal.SIGINT, ctrl_C_handler)
+
+# ==============================================================================
+# main script
+#
+                                                                 # startup delay
+time.sleep(startup_delay);
+                                                                 # setup logging
+if log_file_spec :
+    message_log = logger.log_open(
+        'xpl-dawnDusk', log_file_spec,
+        format='%(asctime)s%(message)s', date_format='%H:%M:%S'
+    )
+                                                                # xPL parameters
+xpl_id = common.xpl_build_id(VENDOR_ID, DEVICE_ID, instance_id);
+xpl_ip = common.xpl_find_ip()
+                                                             # create xPL socket
+(client_port, xpl_socket) = common.xpl_open_socket(
+    common.XPL_PORT, Ethernet_base_port
+)
+                                                    # display working parameters
+if verbose :
+    os.system('clear||cls')
+    print(SEPARATOR)
+    print("Starting dawn dusk indicator on xPL port %s" % client_port)
+    print(INDENT + "latitude  : %g degrees" % latitude)
+    print(INDENT + "longitude : %g degrees" % longitude)
+    print(INDENT + "triggers  : %s" % ', '.join(trigger_events))
+    print()
+
+# ..............................................................................
+                                                                     # main loop
+last_heartbeat_time = 0;
+event_queue = []
+scheduled_day = date.today()
+schedule_day(event_queue, scheduled_day)
+
+while not end :
+                                                 # check time and send heartbeat
+    last_heartbeat_time = common.xpl_send_heartbeat(
+        xpl_socket, xpl_id, xpl_ip, client_port,
+        heartbeat_interval, last_heartbeat_time
+    )
+                                           # schedule the events of the next day
+    while scheduled_day <= date.today() :
+        scheduled_day += timedelta(days=1)
+        schedule_day(event_queue, scheduled_day)
+                                     # wait for the next event or an xPL message
+    timeout = MAXIMAL_SLEEP
+    if event_queue :
+        timeout = min(max(event_queue[0][0] - time.time(), 0), MAXIMAL_SLEEP)
+    (xpl_message, source_address) = common.xpl_get_message(xpl_socket, timeout);
+                                                             # send due triggers
+    while event_queue and (event_queue[0][0] <= time.time()) :
+        (event_time, event) = heapq.heappop(event_queue)
+        if verbose :
+            print("Sending %s trigger message" % event)
+        send_message_with_log(
+            'xpl-trig', '*', "%s.basic" % CLASS_ID, {'status' : event}
+        )
+                                                           # process XPL message
+    if (xpl_message) :
+        (xpl_type, source, target, schema, body) = \
+            common.xpl_get_message_elements(xpl_message)
+        if schema.lower() == CLASS_ID.lower() + '.basic' :
+            if xpl_type == 'xpl-cmnd' :
+                if common.xpl_is_for_me(xpl_id, target) :
+                    command = body.get('command', '')
+                    if verbose :
+                        print("Received \"%s\" query from \"%s\"" % (
+                            command, source
+                        ))
+                    if command == 'status' :
+                        day = date.today()
+                        if body.get('day', '').isdigit() :
+                            day = date(day.year, 1, 1) + timedelta(
+                                days=int(body['day']) - 1
+                            )
+                        send_message_with_log(
+                            'xpl-stat', source, "%s.response" % CLASS_ID,
+                            build_times_status(body.get('query', 'all'), day)
+                        )
+                                                             # delete xPL socket
+common.xpl_disconnect(xpl_socket, xpl_id, xpl_ip, client_port)
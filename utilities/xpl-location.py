@@ -11,6 +11,7 @@ from http.server import BaseHTTPRequestHandler, HTTPServer
 from http import HTTPStatus
 sys.path.append(sys.path[0]+'/../xPL-base')
 import common
+import logger
 
 # ------------------------------------------------------------------------------
 # constants
@@ -19,7 +20,7 @@ VENDOR_ID = 'dspc';             # from xplproject.org
 DEVICE_ID = 'location';         # max 8 chars
 CLASS_ID = 'location';          # max 8 chars
 
-LOG_FILE_LENGTH = 60*24*3
+LOG_FILE_SIZE = 60*24*3*100;    # about 3 days of points each minute
 
 INDENT = '  '
 SEPARATOR = 80 * '-'
@@ -285,27 +286,41 @@ def check_distance_state(device, longitude, latitude) :
 # log GPS info to file
 #
 def log_GPS_info(device, parameters) :
-                                                               # build file spec
-    log_file_spec = os.sep.join([log_directory, device + '.log'])
-                                                                     # read file
-    log_file_lines = []
-    if os.path.isfile(log_file_spec) :
-        log_file_lines = open(log_file_spec, "r").read().split("\n")
                                                                       # add info
     log_line = ''
     for (parameter, value) in parameters.items() :
         log_line = "%s, %s : %s" % (log_line, parameter, value)
     log_line = log_line[2:]
-    log_file_lines.append(log_line)
-                                                                    # write file
-    open(log_file_spec, "w").write(
-        "\n".join(log_file_lines[-LOG_FILE_LENGTH:])
-    )
+    get_device_log(device).info(log_line)
+
+#-------------------------------------------------------------------------------
+# get the log of a device
+#
+def get_device_log(device) :
+    if device not in device_logs :
+                                                               # build file spec
+        log_file_spec = os.sep.join([log_directory, device + '.log'])
+                                          # older logs miss the last end of line
+        if os.path.isfile(log_file_spec) and os.path.getsize(log_file_spec) :
+            log_file = open(log_file_spec, 'rb+')
+            log_file.seek(-1, os.SEEK_END)
+            if log_file.read(1) != b'\n' :
+                log_file.write(b'\n')
+            log_file.close()
+                                                                      # open log
+        device_logs[device] = logger.log_open(
+            'xpl-location.' + device, log_file_spec,
+            max_bytes=LOG_FILE_SIZE, format='%(message)s'
+        )
+
+    return(device_logs[device])
 
 #-------------------------------------------------------------------------------
 # create map
 #
 def create_map(log_file_spec) :
+                                                       # wait for pending points
+    logger.log_flush()
                                                                      # read file
     buildMap.create_plot(
         log_file_spec,
@@ -442,7 +457,8 @@ class http_server(BaseHTTPRequestHandler):
         if len(path_elements) == 2 :
             log_file_spec = os.sep.join([log_directory, device + '.log'])
             if os.path.exists(log_file_spec) :
-                os.remove(log_file_spec)
+                get_device_log(device)
+                logger.log_clear('xpl-location.' + device)
                 not_found = False
         if not_found :
             self.send_reply(code=HTTPStatus.NOT_FOUND)
@@ -483,6 +499,7 @@ if verbose :
     print(INDENT + "Reference latitude  : %9.6f" % reference_latitude)
     print(INDENT + "Reference altitude  : %g" % reference_altitude)
 device_distance_state = {}
+device_logs = {}
                                                                     # run server
 server = HTTPServer(('', http_server_port), http_server)
 try:
@@ -4,9 +4,9 @@ import sys
 import signal
 import os
 import time
-from datetime import datetime
 sys.path.append(sys.path[0]+'/../xPL-base')
 import common
+import logger
 import queue
 import sounddevice as sd
 import vosk
@@ -18,7 +18,7 @@ VENDOR_ID = 'dspc';             # from xplproject.org
 DEVICE_ID = 'speech';           # max 8 chars
 CLASS_ID = 'speech';            # max 8 chars
 
-LOG_FILE_LENGTH = 100
+LOG_FILE_SIZE = 100*80;         # about 100 lines
 
 INDENT = '  '
 SEPARATOR = 80 * '-'
@@ -112,17 +112,7 @@ def callback(indata, frames, time, status):
 # Log a phrase
 #
 def log_phrase(text) :
-                                                         # limit log file length
-    if os.path.isfile(log_file_spec) :
-        log_file_lines = open(log_file_spec, "r").read().split("\n")
-        log_file = open(log_file_spec, "w")
-        log_file.write("\n".join(log_file_lines[-LOG_FILE_LENGTH:]))
-        log_file.close()
-                                                                      # log text
-    time_stamp = datetime.now().strftime("%Hh%M")
-    log_file = open(log_file_spec, 'a')
-    log_file.write("%s : %s\n" % (time_stamp, text))
-    log_file.close()
+    phrase_log.info(text)
 
 # ------------------------------------------------------------------------------
 # catch ctrl-C interrupt
@@ -157,6 +147,12 @@ if verbose :
     print(INDENT + "data type   : %s" % data_type)
     print(INDENT + "block size  : %d" % block_size)
     print()
+                                                                 # setup logging
+phrase_log = logger.log_open(
+    'xpl-speechToText', log_file_spec,
+    max_bytes=LOG_FILE_SIZE, format='%(asctime)s : %(message)s',
+    date_format='%Hh%M'
+)
                                                                    # setup queue
 recording_queue = queue.Queue()
                                                                     # setup vosk
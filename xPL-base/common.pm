@@ -11,6 +11,11 @@ use Exporter;
 use vars qw($VERSION @ISA @EXPORT);
 
 my $MAX_MESSAGE_LENGTH = 1024;
+my $RELIABLE_CACHE_SIZE = 256;  # message ids remembered to discard duplicates
+my $ACKNOWLEDGE_CLASS = 'ack.basic';
+
+my @received_message_ids;
+my %received_message_ids;
 
 $VERSION = 1.00;
 @ISA     = qw(Exporter);
@@ -24,9 +29,12 @@ $VERSION = 1.00;
   &xpl_build_id
   &xpl_open_socket
   &xpl_send_broadcast
-  &xpl_send_message
+  &xpl_send_message &xpl_send_traced_message
   &xpl_get_message_elements
   &xpl_is_only_for_me &xpl_is_for_me
+  &xpl_get_header_value
+  &xpl_get_message_trace
+  &xpl_accept_message
   &xpl_get_message
   &xpl_send_heartbeat
   &xpl_disconnect
@@ -163,12 +171,30 @@ sub xpl_send_broadcast {
 #
 sub xpl_send_message {
 	my ($xpl_socket, $xpl_port, $type, $source, $target, $class, %body) = @_;
+                                                              # send xPL message
+  xpl_send_traced_message(
+    $xpl_socket, $xpl_port, '', $type, $source, $target, $class, %body
+  );
+}
+
+#-------------------------------------------------------------------------------
+# Send xPL message with a trace header line to broadcast address
+#
+# The trace is a string as returned by xpl_get_message_trace,
+# no trace line is added if it is empty.
+#
+sub xpl_send_traced_message {
+	my ($xpl_socket, $xpl_port, $trace,
+	    $type, $source, $target, $class, %body) = @_;
                                                              # build xPL message
   my $message = "$type\n";
   $message .= "{\n";
   $message .= "hop=1\n";
   $message .= "source=$source\n";
   $message .= "target=$target\n";
+  if ($trace ne '') {
+    $message .= "trace=$trace\n";
+  }
   $message .= "}\n";
   $message .= "$class\n";
   $message .= "{\n";
@@ -239,6 +265,76 @@ sub xpl_is_for_me {
   return ($matches);
 }
 
+#-------------------------------------------------------------------------------
+# Get the value of an optional header line
+#
+sub xpl_get_header_value {
+	my ($message, $parameter) = @_;
+                                                         # search in header only
+  my $value = '';
+  my ($header) = split(/}/, $message);
+  if ($header =~ m/\n\Q$parameter\E=([^\r\n]*)/) {
+    $value = $1;
+  }
+
+  return ($value);
+}
+
+#-------------------------------------------------------------------------------
+# Get the trace of a received message, advanced by one hop
+#
+# The returned trace is the one to be stamped on the messages emitted
+# in response to the received message.
+# The function returns an empty string if the message has not been traced.
+#
+sub xpl_get_message_trace {
+	my ($message) = @_;
+                                                        # find trace header line
+  my $trace = '';
+  my $trace_string = xpl_get_header_value($message, 'trace');
+  if ($trace_string =~ m/\A([^:]+):(\d+):([\d.]+):([\d.]+)\Z/) {
+    $trace = join(':', $1, $2+1, $3, $4);
+  }
+
+  return ($trace);
+}
+
+#-------------------------------------------------------------------------------
+# Acknowledge a received command and check if it is a duplicate
+#
+# Commands without "msgid" header line are always accepted.
+# Retransmitted duplicates are acknowledged again, because the first
+# acknowledge might have been lost, but are not accepted.
+#
+sub xpl_accept_message {
+	my ($xpl_socket, $xpl_id, $message, $source) = @_;
+                                                                # get message id
+  my $accepted = 1;
+  my $message_id = xpl_get_header_value($message, 'msgid');
+  if ($message_id ne '') {
+                                                              # send acknowledge
+    xpl_send_message(
+      $xpl_socket, $xpl_port,
+      'xpl-stat', $xpl_id, $source, $ACKNOWLEDGE_CLASS,
+      ('msgid' => $message_id)
+    );
+                                                          # check for duplicates
+    my $key = "$source $message_id";
+    if (exists($received_message_ids{$key})) {
+      $accepted = 0;
+    }
+    else {
+      $received_message_ids{$key} = 1;
+      push(@received_message_ids, $key);
+      if (@received_message_ids > $RELIABLE_CACHE_SIZE) {
+        delete($received_message_ids{shift(@received_message_ids)});
+      }
+    }
+  }
+
+  return ($accepted);
+}
+
 ################################################################################
 # Exported functions: main program
 #
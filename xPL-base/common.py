@@ -2,6 +2,12 @@ import socket
 import sys
 import re
 import time
+import uuid
+import fnmatch
+import struct
+import os
+import threading
+import collections
 
 # ------------------------------------------------------------------------------
 # constants
@@ -11,6 +17,35 @@ INSTANCE_NAME_LENGTH = 16; # instance names have max. 16 chars
 
 ETHERNET_BUFFER_SIZE = 1024
 
+TRACE_ID_LENGTH = 12
+
+CAPTURE_MAGIC = b'xPLcap1\n'
+CAPTURE_RECORD = struct.Struct('<d4sHH');    # time, IPv4, port, length
+CAPTURE_INDEX_RECORD = struct.Struct('<dQ'); # time, capture file offset
+CAPTURE_INDEX_PERIOD = 10;                   # seconds between index entries
+
+SEQUENCE_WINDOW = 64;           # sequence numbers kept for reordering checks
+
+RELIABLE_RETRIES = 5;           # retransmissions before giving up
+RELIABLE_TIMEOUT = 0.2;         # first retransmission delay in seconds
+RELIABLE_CACHE_SIZE = 256;      # message ids remembered to discard duplicates
+ACKNOWLEDGE_CLASS = 'ack.basic'
+
+FILTER_FIELDS = ['type', 'source', 'target', 'schema']
+FILTER_TOKENS = re.compile(r'\s*(\(|\)|!=|!~|=|~|[^\s()=!~]+)')
+
+# ------------------------------------------------------------------------------
+# global variables
+#
+sequence_numbering = False
+sequence_numbers = {}
+sequence_lock = threading.Lock()
+
+reliable_pending = {}
+reliable_statistics = {}
+reliable_lock = threading.Lock()
+received_message_ids = collections.OrderedDict()
+
 
 # ==============================================================================
 # Exported functions: utilities
@@ -90,7 +125,9 @@ def xpl_send_broadcast (xpl_socket, xpl_port, message) :
                                                       # enable broadcasting mode
     xpl_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
                                                         # send broadcast message
-    xpl_socket.sendto(message.encode(), ('<broadcast>', xpl_port))
+    if isinstance(message, str) :
+        message = message.encode()
+    xpl_socket.sendto(message, ('<broadcast>', xpl_port))
 
 #-------------------------------------------------------------------------------
 # Send xPL message to broadcast address
@@ -98,7 +135,7 @@ def xpl_send_broadcast (xpl_socket, xpl_port, message) :
 def xpl_send_message (
     xpl_socket, xpl_port,
     xpl_type, xpl_source, xpl_target, xpl_class,
-    body
+    body, trace=None, sequence=None, message_id=None
 ) :
                                                              # build xPL message
     message = xpl_type + "\n"
@@ -106,6 +143,14 @@ def xpl_send_message (
     message += "hop=1\n";
     message += "source=%s\n" % xpl_source;
     message += "target=%s\n" % xpl_target;
+    if trace :
+        message += "trace=%s\n" % xpl_format_trace(trace);
+    if sequence is None :
+        sequence = sequence_numbering
+    if sequence :
+        message += "seq=%d\n" % xpl_next_sequence_number(xpl_source);
+    if message_id :
+        message += "msgid=%s\n" % message_id;
     message += "}\n";
     message += xpl_class + "\n";
     message += "{\n";
@@ -147,6 +192,69 @@ def xpl_get_message_elements(message) :
                                                                # return elements
     return(xpl_type, source, target, schema, body_dict)
 
+#-------------------------------------------------------------------------------
+# Get the value of an optional header line
+#
+def xpl_get_header_value(message, parameter) :
+                                                         # search in header only
+    value = None
+    header = message.split('}', 1)[0]
+    key = "\n%s=" % parameter
+    if key in header :
+        value = header.split(key, 1)[1].split("\n", 1)[0].strip()
+
+    return(value)
+
+#-------------------------------------------------------------------------------
+# Start a new message trace
+#
+def xpl_new_trace() :
+                                    # trace id, hop count and origin time stamps
+    trace = {
+        'id'        : uuid.uuid4().hex[:TRACE_ID_LENGTH],
+        'hop'       : 0,
+        'wall'      : time.time(),
+        'monotonic' : time.monotonic()
+    }
+
+    return(trace)
+
+#-------------------------------------------------------------------------------
+# Format a trace as an xPL header value
+#
+def xpl_format_trace(trace) :
+
+    trace_string = "%s:%d:%.6f:%.6f" % (
+        trace['id'], trace['hop'], trace['wall'], trace['monotonic']
+    )
+
+    return(trace_string)
+
+#-------------------------------------------------------------------------------
+# Get the trace of a received message, advanced by one hop
+#
+# The returned trace is the one to be stamped on the messages emitted
+# in response to the received message.
+# The function returns None if the message has not been traced.
+#
+def xpl_get_message_trace(message) :
+                                                        # find trace header line
+    trace = None
+    trace_string = xpl_get_header_value(message, 'trace')
+    if trace_string :
+        try :
+            (trace_id, hop, wall, monotonic) = trace_string.split(':')
+            trace = {
+                'id'        : trace_id,
+                'hop'       : int(hop) + 1,
+                'wall'      : float(wall),
+                'monotonic' : float(monotonic)
+            }
+        except ValueError :
+            trace = None
+
+    return(trace)
+
 #-------------------------------------------------------------------------------
 # Check if xPL message is for the client
 #
@@ -166,6 +274,345 @@ def xpl_is_for_me(xpl_id, target) :
 
     return(matches)
 
+#-------------------------------------------------------------------------------
+# Enable sequence numbers on all sent messages
+#
+def xpl_enable_sequence_numbers(enable=True) :
+    global sequence_numbering
+
+    sequence_numbering = enable
+
+#-------------------------------------------------------------------------------
+# Get the next sequence number of a message source
+#
+def xpl_next_sequence_number(xpl_source) :
+                                                       # numbering starts from 1
+    with sequence_lock :
+        sequence_number = sequence_numbers.get(xpl_source, 0) + 1
+        sequence_numbers[xpl_source] = sequence_number
+
+    return(sequence_number)
+
+#-------------------------------------------------------------------------------
+# Get the sequence number of a received message
+#
+def xpl_get_message_sequence_number(message) :
+                                                          # find seq header line
+    sequence_number = None
+    sequence_string = xpl_get_header_value(message, 'seq')
+    if sequence_string :
+        try :
+            sequence_number = int(sequence_string)
+        except ValueError :
+            sequence_number = None
+
+    return(sequence_number)
+
+#-------------------------------------------------------------------------------
+# Create a per source sequence tracker
+#
+# The callbacks are called as callback(source, sequence_number, count) when
+# messages are found to be lost (count is the gap size), duplicated or
+# received out of order.
+#
+def xpl_new_sequence_tracker(on_gap=None, on_duplicate=None, on_reorder=None) :
+
+    tracker = {
+        'sources'   : {},
+        'callbacks' : {
+            'gap'       : on_gap,
+            'duplicate' : on_duplicate,
+            'reordered' : on_reorder
+        }
+    }
+
+    return(tracker)
+
+#-------------------------------------------------------------------------------
+# Track the sequence number of a received message
+#
+# Returns 'new', 'gap', 'duplicate', 'reordered', 'restart', or '' if the
+# message has no sequence number.
+# A source has restarted when its numbering starts over at 1 or after it has
+# sent a hbeat.end message. A repeated first message is a duplicate.
+#
+def xpl_track_sequence(tracker, message, source=None) :
+                                                           # get sequence number
+    sequence_number = xpl_get_message_sequence_number(message)
+    if sequence_number is None :
+        return('')
+    if source is None :
+        source = message.split('source=', 1)[1].split("\n", 1)[0].lower()
+                                                                 # first message
+    sources = tracker['sources']
+    state = sources.get(source)
+    ended = (message.find("}\nhbeat.end\n{") >= 0)
+    if state is None :
+        sources[source] = {
+            'highest' : sequence_number, 'received' : 1, 'lost' : 0,
+            'duplicates' : 0, 'reordered' : 0, 'restarts' : 0,
+            'missing' : set(), 'ended' : ended
+        }
+        return('new')
+                                                # restart, the counters are kept
+    (ended, state['ended']) = (state['ended'], ended)
+    if ((sequence_number == 1) and (ended or (state['highest'] > 1))) or \
+        (sequence_number <= state['highest'] - SEQUENCE_WINDOW) :
+        state['received'] += 1
+        state['restarts'] += 1
+        state['highest'] = sequence_number
+        state['missing'] = set()
+        return('restart')
+                                                                      # classify
+    state['received'] += 1
+    highest = state['highest']
+    count = 1
+    if sequence_number == highest + 1 :
+        status = 'new'
+    elif sequence_number > highest + 1 :
+        status = 'gap'
+        count = sequence_number - highest - 1
+        state['lost'] += count
+        state['missing'].update(range(
+            max(highest + 1, sequence_number - SEQUENCE_WINDOW),
+            sequence_number
+        ))
+    elif sequence_number in state['missing'] :
+        status = 'reordered'
+        state['missing'].discard(sequence_number)
+        state['lost'] -= 1
+        state['reordered'] += 1
+    else :
+        status = 'duplicate'
+        state['received'] -= 1
+        state['duplicates'] += 1
+                                            # update highest and missing numbers
+    if sequence_number > highest :
+        state['highest'] = sequence_number
+    if len(state['missing']) > SEQUENCE_WINDOW :
+        oldest = state['highest'] - SEQUENCE_WINDOW
+        state['missing'] = {n for n in state['missing'] if n > oldest}
+                                                                        # notify
+    callback = tracker['callbacks'].get(status)
+    if callback :
+        callback(source, sequence_number, count)
+
+    return(status)
+
+#-------------------------------------------------------------------------------
+# Get the per source delivery counters
+#
+def xpl_sequence_statistics(tracker) :
+
+    statistics = {}
+    for (source, state) in tracker['sources'].items() :
+        expected = state['received'] + state['lost']
+        statistics[source] = {
+            'received'      : state['received'],
+            'lost'          : state['lost'],
+            'duplicates'    : state['duplicates'],
+            'reordered'     : state['reordered'],
+            'restarts'      : state['restarts'],
+            'delivery_rate' : state['received'] / expected
+        }
+
+    return(statistics)
+
+#-------------------------------------------------------------------------------
+# Compile a filter expression into a message predicate
+#
+# The expression combines comparisons with "and", "or", "not" and parentheses.
+# A comparison is "<field><operator><glob>" where the field is one of "type",
+# "source", "target", "schema" or "body.<parameter>".
+# The operators "=" and "!=" compare as is, "~" and "!~" ignore the case.
+# Example: "schema=sensor.* and body.device~temp*".
+# The returned predicate takes the message elements as they are returned by
+# xpl_get_message_elements().
+#
+def xpl_compile_filter(expression) :
+                                                             # split into tokens
+    tokens = FILTER_TOKENS.findall(expression)
+    if ''.join(tokens) != re.sub(r'\s+', '', expression) :
+        raise ValueError("invalid filter expression \"%s\"" % expression)
+    position = [0]
+                                                           # token list handling
+    def next_token() :
+        token = ''
+        if position[0] < len(tokens) :
+            token = tokens[position[0]]
+        return(token)
+
+    def take_token() :
+        token = next_token()
+        if not token :
+            raise ValueError("unexpected end of filter \"%s\"" % expression)
+        position[0] += 1
+        return(token)
+                                                       # single field comparison
+    def parse_comparison() :
+        field = take_token().lower()
+        operator = take_token()
+        pattern = take_token()
+        if operator not in ['=', '!=', '~', '!~'] :
+            raise ValueError("invalid operator \"%s\"" % operator)
+        flags = 0
+        if '~' in operator :
+            flags = re.IGNORECASE
+        matcher = re.compile(fnmatch.translate(pattern), flags).match
+        negate = operator.startswith('!')
+        if field in FILTER_FIELDS :
+            index = FILTER_FIELDS.index(field)
+            def compare(elements) :
+                return((matcher(elements[index]) is None) == negate)
+        elif field.startswith('body.') :
+            parameter = field[len('body.'):]
+            def compare(elements) :
+                value = elements[4].get(parameter)
+                if value is None :
+                    return(negate)
+                return((matcher(value) is None) == negate)
+        else :
+            raise ValueError("invalid filter field \"%s\"" % field)
+        return(compare)
+                                                      # negation and parentheses
+    def parse_factor() :
+        token = next_token()
+        if token.lower() == 'not' :
+            take_token()
+            factor = parse_factor()
+            return(lambda elements : not factor(elements))
+        if token == '(' :
+            take_token()
+            factor = parse_or()
+            if take_token() != ')' :
+                raise ValueError("missing \")\" in \"%s\"" % expression)
+            return(factor)
+        return(parse_comparison())
+                                                             # "and" before "or"
+    def parse_and() :
+        factors = [parse_factor()]
+        while next_token().lower() == 'and' :
+            take_token()
+            factors.append(parse_factor())
+        if len(factors) == 1 :
+            return(factors[0])
+        return(lambda elements : all(f(elements) for f in factors))
+
+    def parse_or() :
+        terms = [parse_and()]
+        while next_token().lower() == 'or' :
+            take_token()
+            terms.append(parse_and())
+        if len(terms) == 1 :
+            return(terms[0])
+        return(lambda elements : any(t(elements) for t in terms))
+                                                               # build predicate
+    predicate = parse_or()
+    if next_token() :
+        raise ValueError(
+            "unexpected \"%s\" in filter \"%s\"" % (next_token(), expression)
+        )
+
+    return(predicate)
+
+#-------------------------------------------------------------------------------
+# Open a capture file for appending
+#
+# Each record holds the arrival time, the source address and the raw bytes.
+# An index file with the ".idx" extension gets the file offset of the first
+# record every CAPTURE_INDEX_PERIOD seconds.
+#
+def xpl_capture_open(file_spec) :
+                                                               # open both files
+    capture_file = open(file_spec, 'ab')
+    if capture_file.tell() == 0 :
+        capture_file.write(CAPTURE_MAGIC)
+    index_file = open(file_spec + '.idx', 'ab')
+    capture = {
+        'file'            : capture_file,
+        'index'           : index_file,
+        'last_index_time' : 0
+    }
+
+    return(capture)
+
+#-------------------------------------------------------------------------------
+# Append a message to a capture file
+#
+def xpl_capture_write(capture, arrival_time, source_address, raw_message) :
+                                                       # index and flush to disk
+    offset = capture['file'].tell()
+    if arrival_time - capture['last_index_time'] >= CAPTURE_INDEX_PERIOD :
+        capture['file'].flush()
+        capture['index'].write(
+            CAPTURE_INDEX_RECORD.pack(arrival_time, offset)
+        )
+        capture['index'].flush()
+        capture['last_index_time'] = arrival_time
+                                                                  # write record
+    (ip_address, port) = source_address
+    capture['file'].write(
+        CAPTURE_RECORD.pack(
+            arrival_time, socket.inet_aton(ip_address), port, len(raw_message)
+        )
+    )
+    capture['file'].write(raw_message)
+
+#-------------------------------------------------------------------------------
+# Close a capture file
+#
+def xpl_capture_close(capture) :
+
+    capture['file'].close()
+    capture['index'].close()
+
+#-------------------------------------------------------------------------------
+# Read the records of a capture file within a time range
+#
+# The index is used to seek close to the start time.
+# The function yields (arrival_time, (ip_address, port), raw_message) tuples.
+#
+def xpl_capture_read(file_spec, start_time=0, end_time=None) :
+                                               # find offset from the time index
+    offset = len(CAPTURE_MAGIC)
+    index_file_spec = file_spec + '.idx'
+    if os.path.isfile(index_file_spec) :
+        index_file = open(index_file_spec, 'rb')
+        index_data = index_file.read()
+        index_file.close()
+        index_data = index_data[
+            :len(index_data) - len(index_data) % CAPTURE_INDEX_RECORD.size
+        ]
+        for (index_time, index_offset) in \
+            CAPTURE_INDEX_RECORD.iter_unpack(index_data) :
+            if index_time > start_time :
+                break
+            offset = index_offset
+                                                                  # read records
+    capture_file = open(file_spec, 'rb')
+    if capture_file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC :
+        capture_file.close()
+        raise ValueError("%s is not an xPL capture file" % file_spec)
+    capture_file.seek(offset)
+    while True :
+        header = capture_file.read(CAPTURE_RECORD.size)
+        if len(header) < CAPTURE_RECORD.size :
+            break
+        (arrival_time, ip_address, port, length) = \
+            CAPTURE_RECORD.unpack(header)
+        raw_message = capture_file.read(length)
+        if len(raw_message) < length :
+            break
+        if (end_time is not None) and (arrival_time > end_time) :
+            break
+        if arrival_time >= start_time :
+            yield(
+                arrival_time,
+                (socket.inet_ntoa(ip_address), port),
+                raw_message
+            )
+    capture_file.close()
+
 # ==============================================================================
 # Exported functions for main programs
 #
@@ -175,15 +622,24 @@ def xpl_is_for_me(xpl_id, target) :
 #
 def xpl_get_message(xpl_socket, timeout) :
                                                     # read message from UDP port
+    (message, source_address) = xpl_get_datagram(xpl_socket, timeout)
+    message = message.decode()
+                                                                # return message
+    return(message, source_address)
+
+#-------------------------------------------------------------------------------
+# Get the raw bytes of a UDP datagram with timeout
+#
+def xpl_get_datagram(xpl_socket, timeout) :
+                                                   # read datagram from UDP port
     xpl_socket.settimeout(timeout)
     try:
-        (message, source_address) = xpl_socket.recvfrom(ETHERNET_BUFFER_SIZE)
-        message = message.decode()
+        (datagram, source_address) = xpl_socket.recvfrom(ETHERNET_BUFFER_SIZE)
     except socket.timeout:
-        message = ''
+        datagram = b''
         source_address = ''
-                                                                # return message
-    return(message, source_address)
+                                                               # return datagram
+    return(datagram, source_address)
 
 #-------------------------------------------------------------------------------
 # Check for elapsed time and send heartbeat
@@ -225,3 +681,198 @@ def xpl_disconnect(xpl_socket, xpl_id, xpl_ip, client_port) :
     );
                                                                   # close socket
     xpl_socket.close()
+
+#-------------------------------------------------------------------------------
+# Send a command which is retransmitted until it is acknowledged
+#
+# The message gets a "msgid" header line. The receiver acknowledges it with
+# an xpl-stat ack.basic message and discards the retransmitted duplicates.
+# Retransmissions are done by xpl_retransmit_pending() with an exponential
+# backoff starting at the given timeout.
+#
+def xpl_send_reliable_message (
+    xpl_socket, xpl_port,
+    xpl_type, xpl_source, xpl_target, xpl_class,
+    body, trace=None, retries=RELIABLE_RETRIES, timeout=RELIABLE_TIMEOUT
+) :
+                                                      # register pending message
+    message_id = uuid.uuid4().hex[:TRACE_ID_LENGTH]
+    command = xpl_class
+    if 'command' in body :
+        command = "%s %s" % (xpl_class, body['command'])
+    now = time.monotonic()
+    with reliable_lock :
+        reliable_pending[message_id] = {
+            'message'  : (
+                xpl_type, xpl_source, xpl_target, xpl_class, body, trace
+            ),
+            'port'     : xpl_port,
+            'command'  : command,
+            'sent'     : now,
+            'delay'    : timeout,
+            'next'     : now + timeout,
+            'retries'  : retries,
+            'attempts' : 1
+        }
+        counters = reliable_statistics.setdefault(command, {
+            'sent' : 0, 'acknowledged' : 0, 'failed' : 0, 'retries' : 0,
+            'latency_sum' : 0.0, 'latency_max' : 0.0
+        })
+        counters['sent'] += 1
+                                                                  # send message
+    xpl_send_message(
+        xpl_socket, xpl_port,
+        xpl_type, xpl_source, xpl_target, xpl_class,
+        body, trace, message_id=message_id
+    )
+
+    return(message_id)
+
+#-------------------------------------------------------------------------------
+# Retransmit the pending commands which have not been acknowledged in time
+#
+# Returns the ids of the commands which have run out of retries.
+#
+def xpl_retransmit_pending(xpl_socket) :
+                                                             # find due messages
+    now = time.monotonic()
+    to_send = []
+    failed = []
+    with reliable_lock :
+        for (message_id, pending) in list(reliable_pending.items()) :
+            if now >= pending['next'] :
+                if pending['retries'] <= 0 :
+                    del reliable_pending[message_id]
+                    reliable_statistics[pending['command']]['failed'] += 1
+                    failed.append(message_id)
+                else :
+                    pending['retries'] -= 1
+                    pending['attempts'] += 1
+                    pending['delay'] *= 2
+                    pending['next'] = now + pending['delay']
+                    reliable_statistics[pending['command']]['retries'] += 1
+                    to_send.append((message_id, pending))
+                                                               # retransmit them
+    for (message_id, pending) in to_send :
+        (xpl_type, xpl_source, xpl_target, xpl_class, body, trace) = \
+            pending['message']
+        xpl_send_message(
+            xpl_socket, pending['port'],
+            xpl_type, xpl_source, xpl_target, xpl_class,
+            body, trace, message_id=message_id
+        )
+
+    return(failed)
+
+#-------------------------------------------------------------------------------
+# Get the time to wait before the next retransmission
+#
+def xpl_next_retransmit_timeout(timeout) :
+
+    with reliable_lock :
+        if reliable_pending :
+            next_time = min(
+                pending['next'] for pending in reliable_pending.values()
+            )
+            timeout = max(min(timeout, next_time - time.monotonic()), 0)
+
+    return(timeout)
+
+#-------------------------------------------------------------------------------
+# Process an acknowledge message
+#
+# Returns True if the message acknowledges a pending command.
+#
+def xpl_process_acknowledge(xpl_type, schema, body) :
+                                                         # check for ack message
+    acknowledged = False
+    if (xpl_type == 'xpl-stat') and (schema == ACKNOWLEDGE_CLASS) :
+        message_id = body.get('msgid')
+        with reliable_lock :
+            pending = reliable_pending.pop(message_id, None)
+            if pending :
+                latency = time.monotonic() - pending['sent']
+                counters = reliable_statistics[pending['command']]
+                counters['acknowledged'] += 1
+                counters['latency_sum'] += latency
+                counters['latency_max'] = max(counters['latency_max'], latency)
+                acknowledged = True
+
+    return(acknowledged)
+
+#-------------------------------------------------------------------------------
+# Check if a command is still waiting for its acknowledge
+#
+def xpl_is_pending(message_id) :
+
+    with reliable_lock :
+        is_pending = message_id in reliable_pending
+
+    return(is_pending)
+
+#-------------------------------------------------------------------------------
+# Wait for the acknowledge of a reliable command
+#
+# Messages other than the acknowledges are discarded.
+# Returns True if the command has been acknowledged.
+#
+def xpl_wait_acknowledge(xpl_socket, message_id) :
+                                             # receive and retransmit until done
+    acknowledged = True
+    while xpl_is_pending(message_id) :
+        timeout = xpl_next_retransmit_timeout(1)
+        (message, source_address) = xpl_get_message(xpl_socket, timeout)
+        if message :
+            (xpl_type, source, target, schema, body) = \
+                xpl_get_message_elements(message)
+            xpl_process_acknowledge(xpl_type, schema, body)
+        if message_id in xpl_retransmit_pending(xpl_socket) :
+            acknowledged = False
+
+    return(acknowledged)
+
+#-------------------------------------------------------------------------------
+# Get the per command delivery counters
+#
+def xpl_reliable_statistics() :
+
+    statistics = {}
+    with reliable_lock :
+        for (command, counters) in reliable_statistics.items() :
+            statistics[command] = dict(counters)
+            statistics[command]['latency_average'] = 0.0
+            if counters['acknowledged'] :
+                statistics[command]['latency_average'] = \
+                    counters['latency_sum'] / counters['acknowledged']
+
+    return(statistics)
+
+#-------------------------------------------------------------------------------
+# Acknowledge a received command and check if it is a duplicate
+#
+# Commands without "msgid" header line are always accepted.
+# Retransmitted duplicates are acknowledged again, because the first
+# acknowledge might have been lost, but are not accepted.
+#
+def xpl_accept_message(xpl_socket, xpl_id, message, source) :
+                                                                # get message id
+    accepted = True
+    message_id = xpl_get_header_value(message, 'msgid')
+    if message_id :
+                                                              # send acknowledge
+        xpl_send_message(
+            xpl_socket, XPL_PORT,
+            'xpl-stat', xpl_id, source, ACKNOWLEDGE_CLASS,
+            {'msgid' : message_id}
+        )
+                                                          # check for duplicates
+        with reliable_lock :
+            key = (source, message_id)
+            if key in received_message_ids :
+                accepted = False
+            else :
+                received_message_ids[key] = True
+                if len(received_message_ids) > RELIABLE_CACHE_SIZE :
+                    received_message_ids.popitem(last=False)
+
+    return(accepted)
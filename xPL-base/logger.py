@@ -0,0 +1,104 @@
+import os
+import queue
+import atexit
+import threading
+import logging
+import logging.handlers
+
+# ------------------------------------------------------------------------------
+# constants
+#
+LOG_MAX_BYTES = 1024*1024;      # size at which a log file is rolled over
+LOG_BACKUP_COUNT = 1;           # rolled over files kept
+LOG_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# ------------------------------------------------------------------------------
+# global variables
+#
+log_queue = queue.Queue()
+log_listener = None
+log_handlers = {}
+log_lock = threading.Lock()
+
+# ==============================================================================
+# Asynchronous logging
+#   the services only put their records on a queue,
+#   a single background writer appends them to the log files
+#
+
+#-------------------------------------------------------------------------------
+# Start the background writer
+#
+def log_start_writer() :
+    global log_listener
+                                                             # start writer once
+    if log_listener is None :
+        log_listener = logging.handlers.QueueListener(log_queue)
+        log_listener.start()
+        atexit.register(log_stop_writer)
+
+#-------------------------------------------------------------------------------
+# Stop the background writer after the queued records have been written
+#
+def log_stop_writer() :
+    global log_listener
+
+    with log_lock :
+        if log_listener is not None :
+            log_listener.stop()
+            log_listener = None
+
+#-------------------------------------------------------------------------------
+# Open a log file and return the logger writing to it
+#   the file is rolled over when it reaches max_bytes
+#
+def log_open(
+    name, file_spec,
+    max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+    format=LOG_FORMAT, date_format=LOG_DATE_FORMAT
+) :
+    logger = logging.getLogger(name)
+    with log_lock :
+        if name not in log_handlers :
+            log_start_writer()
+                                                    # file writer, in background
+            handler = logging.handlers.RotatingFileHandler(
+                file_spec, maxBytes=max_bytes, backupCount=backup_count
+            )
+            handler.setFormatter(logging.Formatter(format, date_format))
+            handler.addFilter(logging.Filter(name))
+            log_handlers[name] = handler
+            log_listener.handlers = tuple(log_handlers.values())
+                                                        # logger, in the service
+            logger.addHandler(logging.handlers.QueueHandler(log_queue))
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+                                                                 # return logger
+    return(logger)
+
+#-------------------------------------------------------------------------------
+# Wait for the queued records to be written
+#
+def log_flush() :
+    log_queue.join()
+
+#-------------------------------------------------------------------------------
+# Delete a log file together with its rolled over copies
+#
+def log_clear(name) :
+    log_flush()
+    with log_lock :
+        if name in log_handlers :
+            handler = log_handlers[name]
+            handler.acquire()
+            try :
+                handler.close()
+                file_spec = handler.baseFilename
+                for index in range(handler.backupCount + 1) :
+                    if index > 0 :
+                        file_spec = "%s.%d" % (handler.baseFilename, index)
+                    if os.path.exists(file_spec) :
+                        os.remove(file_spec)
+            finally :
+                handler.release()
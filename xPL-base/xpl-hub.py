@@ -103,8 +103,38 @@ def log_client_list(log_file_spec, clients) :
     log_file.write("Ports and associated xPL clients:\n")
     for port in clients.keys() :
         log_file.write(INDENT + "%d: %s\n" % (port, clients[port]))
+                                                     # sequence numbered sources
+    delivery = common.xpl_sequence_statistics(sequence_tracker)
+    if delivery :
+        log_file.write("Delivery of sequence numbered messages:\n")
+    for (source, counters) in delivery.items() :
+        log_file.write(
+            INDENT + "%s: %.2f%% received, %d lost, %d duplicate(s), "
+            "%d reordered\n" % (
+                source, 100*counters['delivery_rate'], counters['lost'],
+                counters['duplicates'], counters['reordered']
+            )
+        )
     log_file.close();
 
+#-------------------------------------------------------------------------------
+# Report sequence number anomalies
+#
+def report_sequence_gap(source, sequence_number, count) :
+    if verbose :
+        print(
+            "Lost %d message(s) from %s before #%d"
+            % (count, source, sequence_number)
+        )
+
+def report_sequence_duplicate(source, sequence_number, count) :
+    if verbose :
+        print("Duplicate message #%d from %s" % (sequence_number, source))
+
+def report_sequence_reorder(source, sequence_number, count) :
+    if verbose :
+        print("Out of order message #%d from %s" % (sequence_number, source))
+
 # ------------------------------------------------------------------------------
 # catch ctrl-C interrupt
 #
@@ -144,6 +174,9 @@ if debug :
                                                                      # main loop
 clients = {}
 timeouts = {}
+sequence_tracker = common.xpl_new_sequence_tracker(
+    report_sequence_gap, report_sequence_duplicate, report_sequence_reorder
+)
 
 while not end :
                                              # get message and source IP address
@@ -158,6 +191,8 @@ while not end :
         if debug :
             print("received from: %s" % source_address)
             print(message)
+                                                       # check for lost messages
+        common.xpl_track_sequence(sequence_tracker, message)
                                              # check for local heartbeat message
         if (message_is_local(source_address, local_addresses)) :
             (xpl_type, source, target, schema, body) = \
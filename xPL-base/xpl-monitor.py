@@ -4,6 +4,9 @@ import sys
 import signal
 import os
 import time
+import socket
+import json
+import shutil
 import common
 
 # ------------------------------------------------------------------------------
@@ -13,6 +16,13 @@ VENDOR_ID = 'dspc';             # from xplproject.org
 DEVICE_ID = 'monitor';          # max 8 chars
 CLASS_ID = 'monitor';           # max 8 chars
 
+TRACE_TIMEOUT = 2;              # seconds without new hop to close a chain
+OUTPUT_BUFFER_LENGTH = 1000;    # lines before forcing an output flush
+RECEIVE_BUFFER_SIZE = 1 << 20;  # socket buffer for high-rate output modes
+STATISTICS_PERIOD = 1;          # seconds between statistics redraws
+STATISTICS_SMOOTHING = 0.5;     # weight of the previous rates
+HEARTBEAT_TOLERANCE = 1.25;     # heartbeat interval margin, as in the hub
+
 INDENT = '  '
 SEPARATOR = 80 * '-'
 
@@ -49,6 +59,36 @@ parser.add_argument(
 parser.add_argument(
     '-d', '--delay', action='store_true', dest='delay',
     help = 'display delay between messages'
+)
+                                                             # filter expression
+parser.add_argument(
+    '-e', '--expression', default='',
+    help = 'filter expression, as "schema=sensor.* and body.device~temp*"'
+)
+                                                                 # output format
+parser.add_argument(
+    '-o', '--output', default='text',
+    help = 'output format (text, json or compact)'
+)
+                                                                  # flush period
+parser.add_argument(
+    '-F', '--flush', default=1,
+    help = 'the json and compact output flush period in seconds (0: none)'
+)
+                                                                  # capture file
+parser.add_argument(
+    '-r', '--record', default='',
+    help = 'record the messages into a capture file instead of displaying them'
+)
+                                                            # traffic statistics
+parser.add_argument(
+    '-S', '--stats', action='store_true', dest='stats',
+    help = 'display per source and per schema traffic statistics'
+)
+                                                               # trace collector
+parser.add_argument(
+    '-T', '--traces', action='store_true', dest='traces',
+    help = 'collect traced messages and display per-hop latencies'
 )
                                                   # parse command line arguments
 parser_arguments = parser.parse_args()
@@ -58,6 +98,222 @@ instance_id = parser_arguments.id
 heartbeat_interval = int(parser_arguments.timer)
 filter_heartbeats = parser_arguments.filter
 display_delay = parser_arguments.delay
+collect_traces = parser_arguments.traces
+filter_expression = parser_arguments.expression
+output_format = parser_arguments.output
+flush_period = float(parser_arguments.flush)
+capture_file_spec = parser_arguments.record
+display_statistics = parser_arguments.stats
+
+if output_format not in ['text', 'json', 'compact'] :
+    print("%s is not a valid output format." % output_format)
+    sys.exit(1)
+message_filter = None
+if filter_expression :
+    try :
+        message_filter = common.xpl_compile_filter(filter_expression)
+    except ValueError as error :
+        print(error)
+        sys.exit(1)
+
+# ==============================================================================
+# Internal functions
+#
+
+# ------------------------------------------------------------------------------
+# get the elements of a message, None if it is malformed
+#
+def get_message_elements(xpl_message) :
+    elements = None
+    try :
+        elements = common.xpl_get_message_elements(xpl_message)
+    except (ValueError, IndexError) :
+        print("Skipping malformed message %r" % xpl_message, file=sys.stderr)
+
+    return(elements)
+
+# ------------------------------------------------------------------------------
+# add a traced message to its chain
+#
+def add_to_trace_chain(chains, xpl_message, elements, arrival_time) :
+    trace = common.xpl_get_message_trace(xpl_message)
+    if trace :
+        (xpl_type, source, target, schema, body) = elements
+        if not trace['id'] in chains :
+            chains[trace['id']] = {'origin' : trace['wall'], 'hops' : []}
+        chains[trace['id']]['hops'].append(
+            (trace['hop'] - 1, arrival_time, xpl_type, source, schema)
+        )
+        chains[trace['id']]['last'] = arrival_time
+
+# ------------------------------------------------------------------------------
+# display the chains which have received no hop for a while
+#
+def display_closed_trace_chains(chains, now) :
+    closed = []
+    for (trace_id, chain) in chains.items() :
+        if now - chain['last'] >= TRACE_TIMEOUT :
+            closed.append(trace_id)
+    for trace_id in closed :
+        chain = chains.pop(trace_id)
+        hops = sorted(chain['hops'])
+        previous_time = chain['origin']
+        print(SEPARATOR)
+        print(
+            "Trace %s: %d message(s), %.1f ms from origin" % (
+                trace_id, len(hops), 1000*(hops[-1][1] - chain['origin'])
+            )
+        )
+        for (hop, arrival_time, xpl_type, source, schema) in hops :
+            print(
+                INDENT + "hop %d %+9.1f ms  %s %s %s" % (
+                    hop, 1000*(arrival_time - previous_time),
+                    xpl_type, source, schema
+                )
+            )
+            previous_time = arrival_time
+
+# ------------------------------------------------------------------------------
+# format message as a single line
+#
+def format_message_line(elements, arrival_time) :
+    (xpl_type, source, target, schema, body) = elements
+    if output_format == 'json' :
+        line = json.dumps({
+            'time'   : round(arrival_time, 3),
+            'type'   : xpl_type,
+            'source' : source,
+            'target' : target,
+            'schema' : schema,
+            'body'   : body
+        })
+    else :
+        line = "%s.%03d %s %s > %s %s" % (
+            time.strftime('%H:%M:%S', time.localtime(arrival_time)),
+            int(1000*(arrival_time % 1)),
+            xpl_type, source, target, schema
+        )
+        for (parameter, value) in body.items() :
+            line += " %s=%s" % (parameter, value)
+
+    return(line + "\n")
+
+# ------------------------------------------------------------------------------
+# write output buffer
+#
+def flush_output(output_buffer) :
+    if output_buffer :
+        sys.stdout.write(''.join(output_buffer))
+        sys.stdout.flush()
+        output_buffer.clear()
+
+# ------------------------------------------------------------------------------
+# count a message in the traffic statistics
+#
+def count_message(counters, key, length, now) :
+    if key not in counters :
+        counters[key] = {
+            'count' : 0, 'bytes' : 0, 'window_count' : 0, 'window_bytes' : 0,
+            'rate' : 0.0, 'byte_rate' : 0.0, 'last' : now,
+            'interval' : 0, 'heartbeat' : 0, 'ended' : False
+        }
+    counter = counters[key]
+    counter['window_count'] += 1
+    counter['window_bytes'] += length
+    counter['last'] = now
+
+    return(counter)
+
+def update_statistics(statistics, xpl_message, elements, now) :
+    (xpl_type, source, target, schema, body) = elements
+    length = len(xpl_message)
+    count_message(statistics['schemas'], schema, length, now)
+    counter = count_message(statistics['sources'], source, length, now)
+    common.xpl_track_sequence(statistics['sequences'], xpl_message, source)
+                                                      # heartbeat interval check
+    if xpl_type == 'xpl-stat' :
+        if schema == 'hbeat.app' :
+            try :
+                counter['interval'] = int(body.get('interval', 5))
+            except ValueError :
+                counter['interval'] = 5
+            counter['heartbeat'] = now
+            counter['ended'] = False
+        elif schema == 'hbeat.end' :
+            counter['ended'] = True
+
+# ------------------------------------------------------------------------------
+# update the rates and redraw the statistics tables
+#
+def heartbeat_status(counter, now) :
+    status = '-'
+    if counter['ended'] :
+        status = 'ended'
+    elif counter['heartbeat'] :
+        status = 'ok'
+        late_time = counter['interval'] * 60 * HEARTBEAT_TOLERANCE
+        if now - counter['heartbeat'] > late_time :
+            status = 'late'
+
+    return(status)
+
+def statistics_table(title, counters, now, row_nb, delivery=None) :
+    lines = []
+    header = "%-32s %8s %10s %9s %9s" % (
+        title, 'msg/s', 'bytes/s', 'total', 'last [s]'
+    )
+    if delivery is not None :
+        header += " %6s %6s" % ('hbeat', 'lost')
+    lines.append(header)
+    ranking = sorted(
+        counters.items(),
+        key = lambda item : (item[1]['rate'], item[1]['count']),
+        reverse = True
+    )
+    for (key, counter) in ranking[:row_nb] :
+        line = "%-32s %8.1f %10.0f %9d %9.0f" % (
+            key[:32], counter['rate'], counter['byte_rate'],
+            counter['count'], now - counter['last']
+        )
+        if delivery is not None :
+            line += " %6s" % heartbeat_status(counter, now)
+            if key in delivery :
+                line += " %6d" % delivery[key]['lost']
+            else :
+                line += " %6s" % '-'
+        lines.append(line)
+
+    return(lines)
+
+def redraw_statistics(statistics, now) :
+                                                                  # update rates
+    elapsed = now - statistics['last_update']
+    statistics['last_update'] = now
+    for counters in (statistics['sources'], statistics['schemas']) :
+        for counter in counters.values() :
+            counter['rate'] = STATISTICS_SMOOTHING * counter['rate'] \
+                + (1 - STATISTICS_SMOOTHING) * counter['window_count']/elapsed
+            counter['byte_rate'] = STATISTICS_SMOOTHING * counter['byte_rate'] \
+                + (1 - STATISTICS_SMOOTHING) * counter['window_bytes']/elapsed
+            counter['count'] += counter['window_count']
+            counter['bytes'] += counter['window_bytes']
+            counter['window_count'] = 0
+            counter['window_bytes'] = 0
+                                                                  # build tables
+    row_nb = max((shutil.get_terminal_size().lines - 6) // 2, 1)
+    lines = [time.strftime('%H:%M:%S', time.localtime(now))]
+    lines.append(SEPARATOR)
+    lines.extend(statistics_table(
+        'source', statistics['sources'], now, row_nb,
+        common.xpl_sequence_statistics(statistics['sequences'])
+    ))
+    lines.append(SEPARATOR)
+    lines.extend(statistics_table(
+        'schema', statistics['schemas'], now, row_nb
+    ))
+                                                       # clear screen and redraw
+    sys.stdout.write("\033[H\033[2J" + "\n".join(lines) + "\n")
+    sys.stdout.flush()
 
 # ------------------------------------------------------------------------------
 # catch ctrl-C interrupt
@@ -86,12 +342,35 @@ if verbose :
     os.system('clear||cls')
     print(SEPARATOR)
     print(INDENT + "Started UDP socket on port %s" % client_port)
+                                      # absorb bursts in output and record modes
+if (output_format != 'text') or capture_file_spec :
+    xpl_socket.setsockopt(
+        socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE
+    )
 
 # ..............................................................................
                                                                      # main loop
 timeout = 1;
 last_heartbeat_time = 0;
 last_message_time = 0;
+trace_chains = {}
+capture = None
+if capture_file_spec :
+    capture = common.xpl_capture_open(capture_file_spec)
+    if verbose :
+        print(INDENT + "Recording to %s" % capture_file_spec)
+output_buffer = []
+last_flush_time = time.time()
+if (output_format != 'text') and flush_period :
+    timeout = min(timeout, flush_period)
+statistics = {
+    'sources'     : {},
+    'schemas'     : {},
+    'sequences'   : common.xpl_new_sequence_tracker(),
+    'last_update' : time.time()
+}
+if display_statistics :
+    timeout = min(timeout, STATISTICS_PERIOD)
 
 while not end :
                                                  # check time and send heartbeat
@@ -100,13 +379,55 @@ while not end :
         heartbeat_interval, last_heartbeat_time
     )
                                               # get xpl-UDP message with timeout
-    (xpl_message, source_address) = common.xpl_get_message(xpl_socket, timeout);
+    (raw_message, source_address) = common.xpl_get_datagram(xpl_socket, timeout)
+    xpl_message = raw_message.decode(errors='replace')
                                                       # filter XPL hbeat message
     if filter_heartbeats :
         if xpl_message.find("}\nhbeat.app\n{") >= 0 :
             xpl_message = ''
+                                                    # parse XPL message elements
+    elements = None
+    if xpl_message and (
+        message_filter or display_statistics or collect_traces or
+        (output_format != 'text')
+    ) :
+        elements = get_message_elements(xpl_message)
+        if elements is None :
+            xpl_message = ''
+                                                        # filter with expression
+    if xpl_message and message_filter :
+        if not message_filter(elements) :
+            xpl_message = ''
+                                                      # count traffic statistics
+    if display_statistics :
+        now = time.time()
+        if xpl_message :
+            update_statistics(statistics, xpl_message, elements, now)
+        if now - statistics['last_update'] >= STATISTICS_PERIOD :
+            redraw_statistics(statistics, now)
+                                                        # record to capture file
+    elif capture :
+        if xpl_message :
+            common.xpl_capture_write(
+                capture, time.time(), source_address, raw_message
+            )
+                                                          # collect trace chains
+    elif collect_traces :
+        now = time.time()
+        if xpl_message :
+            add_to_trace_chain(trace_chains, xpl_message, elements, now)
+        display_closed_trace_chains(trace_chains, now)
+                                                     # buffer single line output
+    elif output_format != 'text' :
+        now = time.time()
+        if xpl_message :
+            output_buffer.append(format_message_line(elements, now))
+        if (flush_period and (now - last_flush_time >= flush_period)) or \
+            (len(output_buffer) >= OUTPUT_BUFFER_LENGTH) :
+            flush_output(output_buffer)
+            last_flush_time = now
                                                            # display XPL message
-    if (xpl_message) :
+    elif (xpl_message) :
         print(SEPARATOR)
         if display_delay :
             now = time.time()
@@ -115,4 +436,7 @@ while not end :
             print("Delta: %s second(s)" % delta)
         print(xpl_message.rstrip("\n"))
                                                              # delete xPL socket
+flush_output(output_buffer)
+if capture :
+    common.xpl_capture_close(capture)
 common.xpl_disconnect(xpl_socket, xpl_id, xpl_ip, client_port)
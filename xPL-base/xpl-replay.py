@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+import argparse
+import sys
+import signal
+import os
+import time
+from datetime import datetime
+import common
+
+# ------------------------------------------------------------------------------
+# constants
+#
+SLEEP_STEP = 0.1;               # seconds between checks for an interrupt
+
+INDENT = '  '
+SEPARATOR = 80 * '-'
+
+# ------------------------------------------------------------------------------
+# command line arguments
+#
+parser = argparse.ArgumentParser()
+                                                                     # verbosity
+parser.add_argument(
+    '-v', '--verbose', action='store_true', dest='verbose',
+    help = 'verbose console output'
+)
+                                                                 # Ethernet port
+parser.add_argument(
+    '-p', '--port', default=50000,
+    help = 'the clients base UDP port'
+)
+                                                                  # capture file
+parser.add_argument(
+    '-f', '--file', default='/tmp/xpl-capture.bin',
+    help = 'the capture file recorded with "xpl-monitor.py -r"'
+)
+                                                                    # start time
+parser.add_argument(
+    '-b', '--begin', default='',
+    help = 'the replay start time (YYYY-MM-DD HH:MM:SS)'
+)
+                                                                      # end time
+parser.add_argument(
+    '-e', '--end', default='',
+    help = 'the replay end time (YYYY-MM-DD HH:MM:SS)'
+)
+                                                                  # replay speed
+parser.add_argument(
+    '-s', '--speed', default=1,
+    help = 'the replay speed factor (0 for as fast as possible)'
+)
+                                                            # heartbeat messages
+parser.add_argument(
+    '-H', '--heartbeats', action='store_true', dest='heartbeats',
+    help = 'also replay the captured hbeat messages'
+)
+                                                  # parse command line arguments
+parser_arguments = parser.parse_args()
+verbose = parser_arguments.verbose
+Ethernet_base_port = int(parser_arguments.port)
+capture_file_spec = parser_arguments.file
+start_time_string = parser_arguments.begin
+end_time_string = parser_arguments.end
+replay_speed = float(parser_arguments.speed)
+replay_heartbeats = parser_arguments.heartbeats
+
+# ==============================================================================
+# Internal functions
+#
+
+# ------------------------------------------------------------------------------
+# convert a date and time string to seconds since the epoch
+#
+def to_timestamp(time_string, default) :
+    timestamp = default
+    if time_string :
+        try :
+            timestamp = datetime.fromisoformat(time_string).timestamp()
+        except ValueError :
+            print("%s is not a valid time." % time_string)
+            sys.exit(1)
+
+    return(timestamp)
+
+# ------------------------------------------------------------------------------
+# catch ctrl-C interrupt
+#
+end = False
+
+def ctrl_C_handler(sig, frame):
+    global end
+    end = True
+    print('')
+
+signal.signal(signal.SIGINT, ctrl_C_handler)
+
+# ==============================================================================
+# main script
+#
+start_time = to_timestamp(start_time_string, 0)
+end_time = to_timestamp(end_time_string, None)
+if not os.path.isfile(capture_file_spec) :
+    print("Capture file %s not found." % capture_file_spec)
+    sys.exit(1)
+                                                             # create xPL socket
+(client_port, xpl_socket) = common.xpl_open_socket(
+    common.XPL_PORT, Ethernet_base_port
+)
+if verbose :
+    os.system('clear||cls')
+    print(SEPARATOR)
+    print("Replaying %s" % capture_file_spec)
+    print(INDENT + "UDP socket port : %s" % client_port)
+    if replay_speed > 0 :
+        print(INDENT + "speed           : %gx" % replay_speed)
+    else :
+        print(INDENT + "speed           : as fast as possible")
+    print()
+
+# ..............................................................................
+                                                                   # replay loop
+message_count = 0
+first_capture_time = None
+replay_start_time = time.monotonic()
+
+for (capture_time, source_address, raw_message) in common.xpl_capture_read(
+    capture_file_spec, start_time, end_time
+) :
+    if end :
+        break
+                                       # skip heartbeats of the recorded clients
+    if not replay_heartbeats :
+        if raw_message.find(b"}\nhbeat.") >= 0 :
+            continue
+                                                        # wait for original time
+    if first_capture_time is None :
+        first_capture_time = capture_time
+    if replay_speed > 0 :
+        delay = replay_start_time \
+            + (capture_time - first_capture_time) / replay_speed \
+            - time.monotonic()
+        while (delay > 0) and not end :
+            time.sleep(min(delay, SLEEP_STEP))
+            delay = replay_start_time \
+                + (capture_time - first_capture_time) / replay_speed \
+                - time.monotonic()
+        if end :
+            break
+                                                                  # send message
+    common.xpl_send_broadcast(xpl_socket, common.XPL_PORT, raw_message)
+    message_count += 1
+    if verbose :
+        print(
+            "%s from %s" % (
+                datetime.fromtimestamp(capture_time).strftime('%H:%M:%S.%f'),
+                source_address[0]
+            )
+        )
+                                                                  # show summary
+replay_duration = time.monotonic() - replay_start_time
+if verbose :
+    print()
+    print(
+        "Replayed %d message(s) in %.3f s" % (message_count, replay_duration)
+    )
+                                                              # close xPL socket
+xpl_socket.close();
@@ -2,6 +2,7 @@
 import argparse
 import sys
 import re
+import time
 import common
 
 # ------------------------------------------------------------------------------
@@ -53,6 +54,16 @@ parser.add_argument(
 parser.add_argument(
     '-c', '--m_class', default='hbeat.app',
     help = 'xPL message class (class_id.type_id)'
+)
+                                                                 # trace message
+parser.add_argument(
+    '-T', '--trace', action='store_true', dest='trace',
+    help = 'stamp a new trace on the message'
+)
+                                                             # reliable delivery
+parser.add_argument(
+    '-a', '--ack', action='store_true', dest='ack',
+    help = 'retransmit the message until it is acknowledged'
 )
                                                           # additional arguments
 parser.add_argument('args', nargs=argparse.REMAINDER)
@@ -65,6 +76,8 @@ message_type = parser_arguments.type
 message_source = parser_arguments.source
 message_target = parser_arguments.destination
 message_class = parser_arguments.m_class
+trace_message = parser_arguments.trace
+wait_acknowledge = parser_arguments.ack
 message_body = parser_arguments.args
 
 # ------------------------------------------------------------------------------
@@ -115,12 +128,48 @@ for element in message_body :
         (parameter, value) = element.split('=', 2)
         body_dict[parameter] = value
                                                                   # send message
+trace = None
+if trace_message :
+    trace = common.xpl_new_trace()
 if verbose :
     print(INDENT + "Sending %s" % message_body)
-common.xpl_send_message(
-    xpl_socket, common.XPL_PORT,
-    message_type, message_source, message_target, message_class,
-    body_dict
-);
+    if trace :
+        print(INDENT + "with trace %s" % trace['id'])
+if wait_acknowledge :
+                                   # send heartbeat to receive messages from hub
+    common.xpl_send_heartbeat(
+        xpl_socket, message_source, xpl_ip, client_port, 5, 0
+    )
+    send_time = time.monotonic()
+    message_id = common.xpl_send_reliable_message(
+        xpl_socket, common.XPL_PORT,
+        message_type, message_source, message_target, message_class,
+        body_dict, trace
+    )
+    acknowledged = common.xpl_wait_acknowledge(xpl_socket, message_id)
+    round_trip_time = time.monotonic() - send_time
+    statistics = common.xpl_reliable_statistics()
+    for (command, counters) in statistics.items() :
+        if acknowledged :
+            print(
+                "%s acknowledged in %.1f ms after %d retransmission(s)" % (
+                    command, 1000*round_trip_time, counters['retries']
+                )
+            )
+        else :
+            print(
+                "%s not acknowledged after %d retransmission(s)"
+                % (command, counters['retries'])
+            )
+                                                              # close xPL socket
+    common.xpl_disconnect(xpl_socket, message_source, xpl_ip, client_port)
+    if not acknowledged :
+        sys.exit(1)
+else :
+    common.xpl_send_message(
+        xpl_socket, common.XPL_PORT,
+        message_type, message_source, message_target, message_class,
+        body_dict, trace
+    );
                                                               # close xPL socket
-xpl_socket.close();
+    xpl_socket.close();